@@ -0,0 +1,27 @@
+from py4ops import inv_import, iter_async_results
+import asyncio
+
+inv = inv_import(["192.168.3.106", "192.168.3.107", "192.168.3.108"])
+
+async def main():
+
+    async with iter_async_results(
+        inv,
+        "ctolon",
+        None,
+        conn_timeout=10,
+        exec_timeout=10,
+        cmd_list=["uptime"],
+        strict=False,
+        check_ssh_conn=True,
+        max_concurrency=2
+        ) as results:
+        async for result in results:
+            print(result["ip"], "ok" if result["ok"] else result["error"])
+            
+            # Stop the rest of the run once a host succeeded
+            if result["ok"]:
+                break
+    
+if __name__ == "__main__":
+    asyncio.run(main())
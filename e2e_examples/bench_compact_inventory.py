@@ -0,0 +1,104 @@
+"""Peak memory of an async run over a huge inventory.
+
+Generates a YAML inventory of loopback addresses, then runs the async
+pipeline over it in a fresh process per mode and reports the peak RSS.
+Nothing listens on port 22 of these addresses, so every host fails fast
+on the connection check and no SSH server is needed.
+
+    python e2e_examples/bench_compact_inventory.py --hosts 100000 --budget-mb 100
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from py4ops import inv_import, exec_async_main_pipeline, iter_async_results
+
+MODES = {
+    # inv_import options, pipeline options, results streamed as by the CLI
+    "plain": ({}, {}, False),
+    "compact": ({"compact": True}, {"max_concurrency": 256}, True),
+}
+
+
+def write_inventory(path, hosts):
+    with open(path, "w") as f:
+        f.write("all:\n  hosts:\n")
+        for i in range(hosts):
+            f.write(f"    vm-{i}: 127.{i // 65024 % 256}.{i // 254 % 256}.{i % 254 + 1}\n")
+
+async def stream_results(inv, **kwargs):
+    count = 0
+    async with iter_async_results(inv, **kwargs) as results:
+        async for _ in results:
+            count += 1
+    return count
+
+async def collect_results(inv, **kwargs):
+    return len(await exec_async_main_pipeline(inv, **kwargs))
+
+def run_mode(mode, inventory):
+    inv_options, run_options, stream = MODES[mode]
+    start = time.monotonic()
+
+    # Per-host logs are not part of the measure.
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            inv = inv_import(inventory, **inv_options)
+            run_pipeline = stream_results if stream else collect_results
+            count = asyncio.run(run_pipeline(
+                inv,
+                user="bench",
+                password=None,
+                conn_timeout=1,
+                exec_timeout=1,
+                cmd_list=["true"],
+                strict=False,
+                check_ssh_conn=True,
+                **run_options
+                )
+            )
+        finally:
+            sys.stdout = stdout
+
+    # ru_maxrss is in kilobytes on Linux.
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode}: {count} hosts, peak RSS {peak_mb:.0f} MB, {time.monotonic() - start:.1f}s")
+    return peak_mb
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hosts", type=int, default=100000)
+    parser.add_argument("--budget-mb", type=float, default=100, help="Fail when the compact mode peaks above this")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--inventory", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        peak_mb = run_mode(args.mode, args.inventory)
+        sys.exit(1 if args.mode == "compact" and peak_mb > args.budget_mb else 0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inventory = os.path.join(tmp, "inventory.yaml")
+        write_inventory(inventory, args.hosts)
+
+        failed = False
+        for mode in MODES:
+            # A fresh process per mode, so each peak is measured on its own.
+            proc = subprocess.run([
+                sys.executable, __file__, "--mode", mode, "--inventory", inventory, "--budget-mb", str(args.budget_mb)
+            ])
+            failed = failed or proc.returncode != 0
+
+    if failed:
+        print(f"The compact mode is over the budget of {args.budget_mb:.0f} MB.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Run time of inventory order against history order with bounded concurrency.
+
+Runs exec_async_main_pipeline against the local SSH server of
+local_ssh_server.py listening on 127.0.0.1 to 127.0.0.N. The last hosts of
+the inventory are slow, which is the worst case for the inventory order.
+A first run records the durations in a history file, then each order is
+timed over several runs.
+
+    python e2e_examples/bench_history_order.py --hosts 20 --slow 3 --max-concurrency 4
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from py4ops import exec_async_main_pipeline
+from local_ssh_server import start_server, write_ssh_home
+
+
+def slow_cmd(slow_hosts, slow, fast):
+    # The server sets SSH_CONNECTION to "client_ip client_port server_ip server_port".
+    return f"set -- $SSH_CONNECTION; case $3 in {'|'.join(slow_hosts)}) sleep {slow};; *) sleep {fast};; esac"
+
+async def timed_run(inv, cmd, max_concurrency, history_file):
+    start = time.monotonic()
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        results = await exec_async_main_pipeline(
+            inv,
+            "bench",
+            None,
+            conn_timeout=10,
+            exec_timeout=60,
+            cmd_list=cmd,
+            strict=False,
+            check_ssh_conn=False,
+            max_concurrency=max_concurrency,
+            history_file=history_file
+            )
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    assert all(result["ok"] for result in results), [result["error"] for result in results if not result["ok"]]
+    return time.monotonic() - start
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--slow", type=int, default=3, help="Number of slow hosts at the end of the inventory")
+    parser.add_argument("--slow-seconds", type=float, default=1.0)
+    parser.add_argument("--fast-seconds", type=float, default=0.1)
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    hosts = [f"127.0.0.{i}" for i in range(1, args.hosts + 1)]
+    inv = {f"vm-{i}": ip for i, ip in enumerate(hosts)}
+    cmd = slow_cmd(hosts[-args.slow:], args.slow_seconds, args.fast_seconds)
+
+    server, host_key, port = await start_server(hosts=hosts)
+    async with server:
+        with tempfile.TemporaryDirectory() as home:
+            write_ssh_home(home, port, host_key, hosts)
+            os.environ["HOME"] = home
+            history_file = os.path.join(home, "history.json")
+
+            # Records the durations of every host.
+            await timed_run(inv, cmd, args.max_concurrency, history_file)
+
+            for name, order_history in (("inventory order", None), ("history order", history_file)):
+                durations = [await timed_run(inv, cmd, args.max_concurrency, order_history) for _ in range(args.runs)]
+                print(f"{name:<16} mean {sum(durations) / len(durations):.2f}s, best {min(durations):.2f}s over {args.runs} runs")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""Handshakes per second and bytes per second of each transport profile.
+
+Both backends connect to the local SSH server of local_ssh_server.py with
+the options of each profile, open and close connections in a loop, then
+read a large output of zeros from a single session.
+
+    python e2e_examples/bench_transport_profiles.py --handshakes 50 --mb 256
+"""
+
+import argparse
+import asyncio
+import time
+
+import asyncssh
+import paramiko
+
+from py4ops._transport_profiles import (
+    TRANSPORT_PROFILES,
+    asyncssh_connect_options,
+    asyncssh_session_options,
+    paramiko_connect_options,
+    apply_paramiko_session_options,
+)
+from local_ssh_server import start_server
+
+
+def asyncssh_connect(port, profile):
+    return asyncssh.connect("127.0.0.1", port, username="bench", known_hosts=None, **asyncssh_connect_options(profile))
+
+def paramiko_connect(port, profile):
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect(
+        "127.0.0.1",
+        port,
+        username="bench",
+        password="bench",
+        look_for_keys=False,
+        allow_agent=False,
+        **paramiko_connect_options(profile)
+        )
+    return client
+
+async def bench_asyncssh(port, profile, handshakes, size):
+    start = time.monotonic()
+    for _ in range(handshakes):
+        async with asyncssh_connect(port, profile):
+            pass
+    handshake_rate = handshakes / (time.monotonic() - start)
+
+    async with asyncssh_connect(port, profile) as conn:
+        start = time.monotonic()
+        result = await conn.run(f"head -c {size} /dev/zero", encoding=None, check=True, **asyncssh_session_options(profile))
+        byte_rate = len(result.stdout) / (time.monotonic() - start)
+
+    return handshake_rate, byte_rate
+
+def bench_paramiko(port, profile, handshakes, size):
+    start = time.monotonic()
+    for _ in range(handshakes):
+        paramiko_connect(port, profile).close()
+    handshake_rate = handshakes / (time.monotonic() - start)
+
+    client = paramiko_connect(port, profile)
+    try:
+        apply_paramiko_session_options(client, profile)
+        start = time.monotonic()
+        _, stdout, _ = client.exec_command(f"head -c {size} /dev/zero")
+        received = 0
+        while True:
+            chunk = stdout.read(1024 * 1024)
+            if not chunk:
+                break
+            received += len(chunk)
+        byte_rate = received / (time.monotonic() - start)
+    finally:
+        client.close()
+
+    return handshake_rate, byte_rate
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--handshakes", type=int, default=50)
+    parser.add_argument("--mb", type=int, default=256, help="Size of the output read per profile")
+    args = parser.parse_args()
+    size = args.mb * 1024 * 1024
+
+    server, _, port = await start_server()
+    async with server:
+        print(f"{'backend':<10}{'profile':<14}{'handshakes/s':>14}{'MB/s':>10}")
+        for profile in TRANSPORT_PROFILES:
+            handshake_rate, byte_rate = await bench_asyncssh(port, profile, args.handshakes, size)
+            print(f"{'asyncssh':<10}{profile:<14}{handshake_rate:>14.1f}{byte_rate / 1024 / 1024:>10.1f}")
+        for profile in TRANSPORT_PROFILES:
+            # paramiko blocks, the server runs in this event loop.
+            handshake_rate, byte_rate = await asyncio.to_thread(bench_paramiko, port, profile, args.handshakes, size)
+            print(f"{'paramiko':<10}{profile:<14}{handshake_rate:>14.1f}{byte_rate / 1024 / 1024:>10.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
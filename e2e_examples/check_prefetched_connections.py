@@ -0,0 +1,113 @@
+"""Check that every command of a host runs, with and without a prefetched connection.
+
+Runs a list of commands against the local SSH server of local_ssh_server.py
+through the default connect path, with a temporary HOME whose ssh config
+points the hosts at the server port. Rolling runs are also checked with
+prefetched connections that are closed or dropped before they are used.
+
+    python e2e_examples/check_prefetched_connections.py
+"""
+
+import asyncio
+import os
+import socket
+import tempfile
+
+import asyncssh
+
+import py4ops._ssh_orchestration
+from py4ops import iter_async_results
+from py4ops._ssh_orchestration import async_cmd_exec
+from local_ssh_server import start_server, write_ssh_home
+
+HOSTS = ["127.0.0.1", "127.0.0.2", "127.0.0.3"]
+CMD_LIST = ["echo a", "echo b", "echo c"]
+EXPECTED = ["a\n", "b\n", "c\n"]
+
+
+def check_result(name, result):
+    stdouts = [output["stdout"] for output in result["outputs"]]
+    assert result["ok"], f"{name}: {result['error']}"
+    assert stdouts == EXPECTED, f"{name}: {stdouts}"
+    print(f"{name}: ok")
+
+async def run_pipeline(batch_size):
+    async with iter_async_results(
+        HOSTS,
+        "check",
+        None,
+        conn_timeout=5,
+        exec_timeout=5,
+        cmd_list=CMD_LIST,
+        strict=False,
+        check_ssh_conn=False,
+        log_to_console=False,
+        batch_size=batch_size
+        ) as results:
+        return [result async for result in results]
+
+def drop_prefetched_connections(drop):
+    """Make the prefetched connections closed (drop="close"), lost (drop="abort") or lost
+    without it being noticed before the first command (drop="unnoticed") before their use.
+    """
+
+    open_prefetched_connection = py4ops._ssh_orchestration.open_prefetched_connection
+
+    async def open_and_drop(*args, **kwargs):
+        client = await open_prefetched_connection(*args, **kwargs)
+        if drop == "close":
+            client.close()
+            await client.wait_closed()
+        else:
+            client.get_extra_info("socket").shutdown(socket.SHUT_RDWR)
+        if drop == "unnoticed":
+            # The first check still sees the connection open, as with a peer that vanished.
+            is_closed, checks = client.is_closed, []
+
+            def is_closed_after_first_check():
+                checks.append(None)
+                return len(checks) > 1 and is_closed()
+
+            client.is_closed = is_closed_after_first_check
+        return client
+
+    py4ops._ssh_orchestration.open_prefetched_connection = open_and_drop
+    return open_prefetched_connection
+
+async def main():
+    server, host_key, port = await start_server(hosts=HOSTS)
+    async with server:
+        with tempfile.TemporaryDirectory() as home:
+            write_ssh_home(home, port, host_key, HOSTS)
+            os.environ["HOME"] = home
+
+            # Connected by async_cmd_exec itself.
+            check_result("own connection", await async_cmd_exec("127.0.0.1", CMD_LIST, "check", check_ssh_conn=False, log_to_console=False))
+
+            # Connection opened by the caller, which stays open afterwards.
+            async with asyncssh.connect("127.0.0.1", username="check") as client:
+                check_result("given connection", await async_cmd_exec(
+                    "127.0.0.1", CMD_LIST, "check", check_ssh_conn=False, log_to_console=False, client=client
+                    ))
+                assert (await client.run("true")).returncode == 0
+
+            # Pipeline without and with rolling batches, which prefetch connections.
+            for batch_size in (None, 1):
+                results = await run_pipeline(batch_size)
+                assert sorted(result["ip"] for result in results) == HOSTS
+                for result in results:
+                    check_result(f"pipeline, batch_size={batch_size}, {result['ip']}", result)
+
+            # Rolling runs reconnect the hosts whose prefetched connection went away.
+            for drop in ("close", "abort", "unnoticed"):
+                open_prefetched_connection = drop_prefetched_connections(drop)
+                try:
+                    results = await run_pipeline(1)
+                finally:
+                    py4ops._ssh_orchestration.open_prefetched_connection = open_prefetched_connection
+                assert sorted(result["ip"] for result in results) == HOSTS
+                for result in results:
+                    check_result(f"prefetched connection {drop}, {result['ip']}", result)
+
+if __name__ == "__main__":
+    asyncio.run(main())
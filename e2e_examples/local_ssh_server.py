@@ -0,0 +1,97 @@
+"""Local SSH server standing in for a fleet host.
+
+The commands of every session run in a local shell, with SSH_CONNECTION
+set as sshd does. Any client is accepted without authentication, so the
+server only listens on loopback addresses. Listening on several of them,
+such as 127.0.0.1 to 127.0.0.20, stands in for a small fleet.
+
+    python e2e_examples/local_ssh_server.py --port 8022
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+
+import asyncssh
+
+
+class AcceptAllServer(asyncssh.SSHServer):
+    def begin_auth(self, username):
+        # No authentication is required.
+        return False
+
+async def run_command(process):
+    client_ip, client_port = process.get_extra_info("peername")[:2]
+    server_ip, server_port = process.get_extra_info("sockname")[:2]
+    local = await asyncio.create_subprocess_shell(
+        process.command or "true",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=dict(os.environ, SSH_CONNECTION=f"{client_ip} {client_port} {server_ip} {server_port}")
+        )
+    async def copy(source, target):
+        while True:
+            chunk = await source.read(64 * 1024)
+            if not chunk:
+                break
+            target.write(chunk)
+            await target.drain()
+
+    async def copy_stdin():
+        try:
+            await copy(process.stdin, local.stdin)
+            local.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    # The outputs are copied until the end before the exit status is sent.
+    stdin_task = asyncio.ensure_future(copy_stdin())
+    await asyncio.gather(copy(local.stdout, process.stdout), copy(local.stderr, process.stderr))
+    stdin_task.cancel()
+    process.exit(await local.wait())
+
+async def start_server(port=0, hosts=("127.0.0.1",)):
+    """Start the server on the loopback addresses of hosts and return it with its host key and port."""
+
+    if port == 0:
+        # All the addresses listen on the same free port.
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+    host_key = asyncssh.generate_private_key("ssh-ed25519")
+    server = await asyncssh.listen(
+        list(hosts),
+        port,
+        server_host_keys=[host_key],
+        server_factory=AcceptAllServer,
+        process_factory=run_command,
+        encoding=None
+        )
+    return server, host_key, port
+
+def write_ssh_home(home, port, host_key, hosts=("127.0.0.1",)):
+    """Write an ssh config and known_hosts under home so the default connect path reaches the server."""
+
+    os.makedirs(os.path.join(home, ".ssh"), exist_ok=True)
+    with open(os.path.join(home, ".ssh", "config"), "w") as f:
+        f.write(f"Host {' '.join(hosts)}\n    Port {port}\n")
+    with open(os.path.join(home, ".ssh", "known_hosts"), "w") as f:
+        public_key = host_key.export_public_key().decode().strip()
+        for host in hosts:
+            f.write(f"[{host}]:{port} {public_key}\n")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8022)
+    args = parser.parse_args()
+
+    server, host_key, port = await start_server(args.port)
+    print(f"Listening on 127.0.0.1:{port}, host key: {host_key.export_public_key().decode().strip()}")
+    async with server:
+        await server.wait_closed()
+
+if __name__ == "__main__":
+    asyncio.run(main())
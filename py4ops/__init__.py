@@ -13,11 +13,22 @@ warnings.filterwarnings("ignore", category=CryptographyDeprecationWarning, modul
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 
-from ._ssh_orchestration import exec_sync_main_pipeline, exec_async_main_pipeline, sync_cmd_exec, inv_import
+from ._ssh_orchestration import exec_sync_main_pipeline, exec_async_main_pipeline, iter_async_results, AsyncResultIterator, sync_cmd_exec, inv_import
+from ._distributed import exec_distributed_pipeline, serve_worker
+from ._compact_inventory import CompactInventory
+from ._output_filters import make_output_filter
+from ._watch import exec_watch_pipeline
 
 __all__ = [
     "exec_sync_main_pipeline",
-    "exec_async_main_pipeline"
+    "exec_async_main_pipeline",
+    "iter_async_results",
+    "AsyncResultIterator",
     "sync_cmd_exec",
-    "inv_import"
+    "inv_import",
+    "exec_distributed_pipeline",
+    "serve_worker",
+    "CompactInventory",
+    "make_output_filter",
+    "exec_watch_pipeline",
 ]
\ No newline at end of file
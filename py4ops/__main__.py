@@ -5,18 +5,75 @@
 from __future__ import print_function, absolute_import
 import argparse
 import asyncio
+import os
 
-from ._ssh_orchestration import inv_import, exec_sync_main_pipeline, exec_async_main_pipeline, call_check_ssh
+from ._ssh_orchestration import inv_import, exec_sync_main_pipeline, iter_async_results, call_check_ssh
+from ._history import DEFAULT_HISTORY_FILE
+from ._script_cache import parse_script_env
+from ._output_filters import COMPRESSIONS, make_output_filter
+from ._transport_profiles import TRANSPORT_PROFILES, get_transport_profiles_from_yaml
+from ._distributed import exec_distributed_pipeline, serve_worker, WORKER_TOKEN_ENV
+from ._watch import exec_watch_pipeline
 
 
+async def drain_async_results(**kwargs):
+    """
+    Run the commands asynchronously without keeping the per-host results.
+    """
+    async with iter_async_results(**kwargs) as results:
+        async for _ in results:
+            pass
+
 def run(args):
     """
     Run tasks on remote servers.
     """
-    inv_data = inv_import(args.inventory)
+    inv_data = inv_import(args.inventory, compact=args.compact_inventory)
+    script_env = parse_script_env(args.script_env)
+    output_filter = make_output_filter(
+        grep=args.output_grep,
+        head=args.output_head,
+        tail=args.output_tail,
+        max_bytes=args.output_max_bytes,
+        compress=args.output_compress
+        )
+    host_transport_profiles = None
+    if args.inventory.endswith(".yml") or args.inventory.endswith(".yaml"):
+        host_transport_profiles = get_transport_profiles_from_yaml(args.inventory)
 
-    if args.asyncronous:
-        asyncio.run(exec_async_main_pipeline(
+    if args.script_args and not args.script:
+        raise ValueError("Arguments after -- are only passed to a script given with --script.")
+
+    if args.batch_size or args.max_failures:
+        if args.workers or not args.asyncronous:
+            raise ValueError("Rolling batches are only supported in asynchronous mode without workers.")
+        if not args.batch_size:
+            raise ValueError("--max-failures requires --batch-size.")
+
+    if args.workers:
+        if args.script:
+            raise ValueError("Script mode is not supported with workers.")
+        asyncio.run(exec_distributed_pipeline(
+            inv=inv_data,
+            workers=args.workers,
+            user=args.user,
+            password=args.password,
+            conn_timeout=args.conn_timeout,
+            exec_timeout=args.exec_timeout,
+            cmd_list=args.cmd_list,
+            strict=args.strict,
+            check_ssh_conn=args.check_ssh_conn,
+            log_to_console=args.log_to_console,
+            log_to_file=args.log_to_file,
+            shard_size=args.shard_size,
+            token=args.worker_token,
+            transport_profile=args.transport_profile,
+            host_transport_profiles=host_transport_profiles,
+            output_filter=output_filter
+            )
+        )
+    elif args.asyncronous:
+        asyncio.run(drain_async_results(
             inv=inv_data,
             user=args.user,
             password=args.password,
@@ -26,7 +83,17 @@ def run(args):
             strict=args.strict,
             check_ssh_conn=args.check_ssh_conn,
             log_to_console=args.log_to_console,
-            log_to_file=args.log_to_file
+            log_to_file=args.log_to_file,
+            max_concurrency=args.max_concurrency,
+            history_file=args.history_file,
+            batch_size=args.batch_size,
+            max_failures=args.max_failures,
+            script=args.script,
+            script_args=args.script_args,
+            script_env=script_env,
+            transport_profile=args.transport_profile,
+            host_transport_profiles=host_transport_profiles,
+            output_filter=output_filter
             )
         )
     else:
@@ -40,9 +107,52 @@ def run(args):
             strict=args.strict,
             check_ssh_conn=args.check_ssh_conn,
             log_to_console=args.log_to_console,
-            log_to_file=args.log_to_file
+            log_to_file=args.log_to_file,
+            script=args.script,
+            script_args=args.script_args,
+            script_env=script_env,
+            transport_profile=args.transport_profile,
+            host_transport_profiles=host_transport_profiles,
+            output_filter=output_filter
             )
         
+def worker(args):
+    """
+    Serve shards of a distributed run.
+    """
+    try:
+        asyncio.run(serve_worker(args.listen, token=args.token))
+    except KeyboardInterrupt:
+        print("Worker stopped.")
+        
+def watch(args):
+    """
+    Re-run a command on remote servers and report only the changes.
+    """
+    inv_data = inv_import(args.inventory, compact=args.compact_inventory)
+    host_transport_profiles = None
+    if args.inventory.endswith(".yml") or args.inventory.endswith(".yaml"):
+        host_transport_profiles = get_transport_profiles_from_yaml(args.inventory)
+        
+    try:
+        asyncio.run(exec_watch_pipeline(
+            inv=inv_data,
+            user=args.user,
+            password=args.password,
+            conn_timeout=args.conn_timeout,
+            exec_timeout=args.exec_timeout,
+            cmd=args.command,
+            interval=args.interval,
+            iterations=args.iterations,
+            max_concurrency=args.max_concurrency,
+            transport_profile=args.transport_profile,
+            host_transport_profiles=host_transport_profiles,
+            log_to_console=not args.quiet
+            )
+        )
+    except KeyboardInterrupt:
+        print("Watch stopped.")
+        
 def ssh_check(args):
     """
     Check ssh connection to remote servers.
@@ -103,7 +213,11 @@ def py4ops():
     run_parser.add_argument("-i", "--inventory", help="Path to Inventory file to use or single host to connect to", type=str, required=True)
     run_parser.add_argument("-u", "--user", help="User to connect as", type=str, required=False)
     run_parser.add_argument("-p", "--password", help="Password to use for authentication", type=str, required=False)
-    run_parser.add_argument("-cl", "--cmd-list", help="List of commands to execute", type=str, required=True, nargs="*")
+    run_cmd_group = run_parser.add_mutually_exclusive_group(required=True)
+    run_cmd_group.add_argument("-cl", "--cmd-list", help="List of commands to execute", type=str, nargs="*")
+    run_cmd_group.add_argument("-sc", "--script", help="Local script to upload once to a content-addressed cache on each host and execute", type=str)
+    run_parser.add_argument("script_args", help="Arguments passed to the script, given after --", type=str, nargs="*")
+    run_parser.add_argument("-se", "--script-env", help="Environment variables passed to the script as KEY=VALUE", type=str, nargs="*", default=None)
     run_parser.add_argument("-s", "--strict", help="Exit if any command fails", action="store_true")
     run_parser.add_argument("-c", "--check-ssh-conn", help="Check ssh connection before executing commands", action="store_true")
     run_parser.add_argument("-ct", "--conn-timeout", help="Timeout for ssh connection", type=int, default=None)
@@ -111,8 +225,42 @@ def py4ops():
     run_parser.add_argument("-ltc", "--log-to-console", help="Log to console", action="store_true")
     run_parser.add_argument("-ltf", "--log-to-file", help="Log to file", action="store_true")
     run_parser.add_argument("-a", "--asyncronous", help="Execute commands asynchronously", action="store_true")
+    run_parser.add_argument("-w", "--workers", help="Worker addresses (host:port or unix:/path) to split the inventory across", type=str, nargs="*", default=None)
+    run_parser.add_argument("-wt", "--worker-token", help=f"Shared token of the workers (default: ${WORKER_TOKEN_ENV})", type=str, default=os.environ.get(WORKER_TOKEN_ENV))
+    run_parser.add_argument("-ss", "--shard-size", help="Number of hosts per shard sent to a worker", type=int, default=None)
+    run_parser.add_argument("-mc", "--max-concurrency", help="Maximum number of hosts to run at once in asynchronous mode", type=int, default=None)
+    run_parser.add_argument("-hf", "--history-file", help="Start historically slow hosts first using the duration history file", type=str, nargs="?", const=DEFAULT_HISTORY_FILE, default=None)
+    run_parser.add_argument("-ci", "--compact-inventory", help="Store the inventory in packed arrays for huge fleets", action="store_true")
+    run_parser.add_argument("-tp", "--transport-profile", help="SSH transport profile, overridden by transport_profile of inventory groups", type=str, choices=list(TRANSPORT_PROFILES), default=None)
+    run_parser.add_argument("-og", "--output-grep", help="Only transfer output lines matching this extended regex", type=str, default=None)
+    run_parser.add_argument("-oh", "--output-head", help="Only transfer the first N lines of output", type=int, default=None)
+    run_parser.add_argument("-ot", "--output-tail", help="Only transfer the last N lines of output", type=int, default=None)
+    run_parser.add_argument("-omb", "--output-max-bytes", help="Only transfer the first N bytes of output", type=int, default=None)
+    run_parser.add_argument("-oc", "--output-compress", help="Compress output on the remote hosts before transfer", type=str, choices=list(COMPRESSIONS), default=None)
+    run_parser.add_argument("-bs", "--batch-size", help="Run hosts in rolling batches of N hosts or a percentage such as 25%% in asynchronous mode", type=str, default=None)
+    run_parser.add_argument("-mf", "--max-failures", help="Stop the rolling run after a batch once failures exceed N hosts or a percentage such as 10%%", type=str, default=None)
     run_parser.set_defaults(func=run)
     
+    worker_parser = subparsers.add_parser("worker", help="Run a worker that executes shards sent by a coordinator.")
+    worker_parser.add_argument("-l", "--listen", help="Address to listen on (host:port or unix:/path)", type=str, default="127.0.0.1:7722")
+    worker_parser.add_argument("-t", "--token", help=f"Shared token required from coordinators, mandatory on TCP addresses (default: ${WORKER_TOKEN_ENV})", type=str, default=os.environ.get(WORKER_TOKEN_ENV))
+    worker_parser.set_defaults(func=worker)
+    
+    watch_parser = subparsers.add_parser("watch", help="Re-run a command on remote servers and report only the hosts whose result changed.")
+    watch_parser.add_argument("-i", "--inventory", help="Path to Inventory file to use or single host to connect to", type=str, required=True)
+    watch_parser.add_argument("-u", "--user", help="User to connect as", type=str, required=False)
+    watch_parser.add_argument("-p", "--password", help="Password to use for authentication", type=str, required=False)
+    watch_parser.add_argument("-cmd", "--command", help="Command to execute at every iteration", type=str, required=True)
+    watch_parser.add_argument("-n", "--interval", help="Seconds between the start of two iterations", type=float, default=2.0)
+    watch_parser.add_argument("-it", "--iterations", help="Stop after this many iterations", type=int, default=None)
+    watch_parser.add_argument("-ct", "--conn-timeout", help="Timeout for ssh connection", type=int, default=None)
+    watch_parser.add_argument("-et", "--exec-timeout", help="Timeout for ssh command", type=int, default=None)
+    watch_parser.add_argument("-mc", "--max-concurrency", help="Maximum number of hosts to run at once", type=int, default=None)
+    watch_parser.add_argument("-tp", "--transport-profile", help="SSH transport profile, overridden by transport_profile of inventory groups", type=str, choices=list(TRANSPORT_PROFILES), default=None)
+    watch_parser.add_argument("-ci", "--compact-inventory", help="Store the inventory in packed arrays for huge fleets", action="store_true")
+    watch_parser.add_argument("-q", "--quiet", help="Only print which hosts changed, not their output", action="store_true")
+    watch_parser.set_defaults(func=watch)
+    
     ssh_check_parser = subparsers.add_parser("ssh-check", help="Path to Inventory file to use or single host to connect to")
     ssh_check_parser.add_argument("-i", "--inventory", help="IP address of remote server", type=str, required=True)
     ssh_check_parser.add_argument("-s", "--strict", help="Exit if ssh connection fails", action="store_true")
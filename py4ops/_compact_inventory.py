@@ -0,0 +1,241 @@
+"""Memory-compact inventory module.
+
+Addresses are stored as packed integers in arrays and names are interned,
+so a huge fleet costs a few bytes per host instead of a dict entry with two
+string objects.
+"""
+
+import socket
+import struct
+import sys
+from array import array
+from typing import Iterator, List, Tuple, Union
+
+import yaml
+
+from ._checkers import is_valid_ip_address, is_valid_ipv4_address, is_valid_ipv6_address
+
+# The C parser is used when PyYAML was built with libyaml.
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+_IPV4 = 4
+_IPV6 = 6
+
+
+class _YamlAlias(Exception):
+    """Raised when a streamed YAML inventory uses an alias."""
+
+
+class CompactInventory:
+    """Inventory of (vm_name, ip) pairs stored in packed arrays.
+
+    Like the plain inventories, a host is only kept once: an address already
+    in the inventory keeps its position and takes the latest name.
+    """
+
+    def __init__(self):
+        self._families = array("B")
+        self._hi = array("Q")
+        self._lo = array("Q")
+        self._names = []
+        self._has_names = False
+        # Index of each packed address, to merge duplicate hosts.
+        self._indexes = {}
+
+    @classmethod
+    def from_inv(cls, inv: Union[str, dict, list]) -> "CompactInventory":
+        """Build a compact inventory from a YAML file, a list of YAML files, a
+        dictionary as host: ip or ip: host, a list of IP addresses or dictionaries,
+        or a single IP address.
+
+        Hosts are appended while the inventory is read, without building an
+        intermediate dictionary of all the hosts.
+        """
+
+        if isinstance(inv, str) and (inv.endswith(".yml") or inv.endswith(".yaml")):
+            return cls.from_yaml([inv])
+
+        compact = cls()
+        if isinstance(inv, str):
+            compact.append(inv)
+        elif isinstance(inv, dict):
+            compact.extend_pairs(inv)
+        elif isinstance(inv, list):
+            if all(isinstance(i, str) and (i.endswith(".yml") or i.endswith(".yaml")) for i in inv):
+                return cls.from_yaml(inv)
+            for item in inv:
+                if isinstance(item, dict):
+                    compact.extend_pairs(item)
+                else:
+                    compact.append(item)
+        else:
+            raise TypeError("The inventory must be a dictionary, a list or a string.")
+        return compact
+
+    @classmethod
+    def from_yaml(cls, paths: List[str]) -> "CompactInventory":
+        """Build a compact inventory from YAML files of groups with hosts.
+
+        The files are read as a stream of YAML events, so the hosts are added
+        as they are parsed and the document is never loaded as a whole. Files
+        using YAML aliases are loaded as a whole to resolve them.
+        """
+
+        compact = cls()
+        for path in paths:
+            start = len(compact)
+            try:
+                with open(path, "r") as stream:
+                    compact._extend_yaml_events(yaml.parse(stream, Loader=_YAML_LOADER))
+            except _YamlAlias:
+                # Aliases need the anchored nodes, so this file is loaded as a whole.
+                compact._truncate(start)
+                with open(path, "r") as stream:
+                    f = yaml.load(stream, Loader=_YAML_LOADER)
+                if not isinstance(f, dict):
+                    raise TypeError("The YAML file must be a dictionary.")
+                for group in f.values():
+                    compact.extend_pairs(group["hosts"])
+
+        return compact
+
+    def _extend_yaml_events(self, events):
+        """Add the hosts of the groups of a YAML event stream."""
+
+        next(events, None)  # StreamStartEvent
+        next(events, None)  # DocumentStartEvent
+        if not isinstance(_next_node(events), yaml.MappingStartEvent):
+            raise TypeError("The YAML file must be a dictionary.")
+
+        for group in _iter_mapping_keys(events):
+            if not isinstance(_next_node(events), yaml.MappingStartEvent):
+                raise TypeError(f"The group {group} must be a dictionary.")
+            for key in _iter_mapping_keys(events):
+                if key != "hosts":
+                    _skip_node(events)
+                    continue
+                if not isinstance(_next_node(events), yaml.MappingStartEvent):
+                    raise TypeError(f"The hosts of the group {group} must be a dictionary.")
+                for host in _iter_mapping_keys(events):
+                    value = _next_node(events)
+                    if not isinstance(value, yaml.ScalarEvent):
+                        raise TypeError(f"The host {host} of the group {group} must be a single value.")
+                    self.append_pair(host, value.value or None)
+
+    def extend_pairs(self, hosts: dict):
+        """Add hosts given as host: ip or ip: host."""
+
+        for key, value in hosts.items():
+            self.append_pair(str(key), None if value is None else str(value))
+
+    def append_pair(self, key: str, value: Union[str, None]):
+        """Add a host given as host: ip or ip: host."""
+
+        if is_valid_ip_address(key):
+            self.append(key, value)
+        else:
+            self.append(value, key)
+
+    def append(self, ip: str, vm_name: Union[str, None]=None):
+        """Add a host to the inventory, or rename it when its address is already in it."""
+
+        if is_valid_ipv4_address(ip):
+            family, hi, lo = _IPV4, 0, struct.unpack("!I", socket.inet_aton(ip))[0]
+        elif is_valid_ipv6_address(ip):
+            family = _IPV6
+            hi, lo = struct.unpack("!QQ", socket.inet_pton(socket.AF_INET6, ip))
+        else:
+            raise TypeError(f"{ip} is not valid ipv4/ipv6 address.")
+
+        if vm_name is not None:
+            vm_name = sys.intern(vm_name)
+            self._has_names = True
+
+        key = _packed_key(family, hi, lo)
+        index = self._indexes.get(key)
+        if index is not None:
+            if vm_name is not None:
+                self._names[index] = vm_name
+            return
+
+        self._indexes[key] = len(self._families)
+        self._families.append(family)
+        self._hi.append(hi)
+        self._lo.append(lo)
+        self._names.append(vm_name)
+
+    def _truncate(self, length: int):
+        """Remove the hosts added after the first length hosts.
+
+        Names of earlier hosts renamed since then are kept.
+        """
+
+        for index in range(length, len(self)):
+            del self._indexes[_packed_key(self._families[index], self._hi[index], self._lo[index])]
+        del self._families[length:]
+        del self._hi[length:]
+        del self._lo[length:]
+        del self._names[length:]
+        self._has_names = any(name is not None for name in self._names)
+
+    def ip_at(self, index: int) -> str:
+        """Return the address of the host at index."""
+
+        if self._families[index] == _IPV4:
+            return socket.inet_ntoa(struct.pack("!I", self._lo[index]))
+        return socket.inet_ntop(socket.AF_INET6, struct.pack("!QQ", self._hi[index], self._lo[index]))
+
+    def __len__(self) -> int:
+        return len(self._families)
+
+    def __getitem__(self, index: int) -> Tuple[Union[str, None], str]:
+        return self._names[index], self.ip_at(index)
+
+    def __iter__(self) -> Iterator[Tuple[Union[str, None], str]]:
+        for index in range(len(self._families)):
+            yield self._names[index], self.ip_at(index)
+
+    def to_inv(self) -> Union[dict, list]:
+        """Return the inventory as a plain dict or list."""
+
+        if self._has_names:
+            return dict(iter(self))
+        return [ip for _, ip in self]
+
+def _packed_key(family: int, hi: int, lo: int) -> int:
+    """Return an address as a single integer, distinct between IPv4 and IPv6."""
+
+    if family == _IPV4:
+        return lo
+    return (1 << 128) | (hi << 64) | lo
+
+def _next_node(events):
+    """Return the first event of the next YAML node, or None at the end of the stream."""
+
+    event = next(events, None)
+    if isinstance(event, yaml.AliasEvent):
+        raise _YamlAlias()
+    return event
+
+def _iter_mapping_keys(events) -> Iterator[str]:
+    """Yield the keys of a YAML mapping, the caller consuming each value."""
+
+    while True:
+        event = _next_node(events)
+        if event is None or isinstance(event, yaml.MappingEndEvent):
+            return
+        if not isinstance(event, yaml.ScalarEvent):
+            raise TypeError("The keys of the YAML file must be single values.")
+        yield event.value
+
+def _skip_node(events):
+    """Consume the events of a YAML node."""
+
+    depth = 0
+    for event in events:
+        if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
@@ -0,0 +1,356 @@
+"""Distributed coordinator/worker module.
+
+The coordinator splits an inventory into shards and sends each shard to a
+``py4ops worker`` process. Messages are newline delimited JSON objects sent
+over a TCP or Unix socket:
+
+- worker -> coordinator: ``{"type": "challenge", "nonce": ...}``
+- coordinator -> worker: ``{"type": "hello", "mac": ..., "nonce": ...}``, answered with ``{"type": "ready", "mac": ...}``
+- coordinator -> worker: ``{"type": "shard", "shard_id": ..., "hosts": [[vm_name, ip, transport_profile], ...], "params": {...}}``
+- worker -> coordinator: ``{"type": "result", "shard_id": ..., "index": ..., "result": {...}}``
+- worker -> coordinator: ``{"type": "done", "shard_id": ...}``
+- worker -> coordinator: ``{"type": "heartbeat"}`` every HEARTBEAT_INTERVAL seconds
+
+Shards of workers that die, or stay silent for HEARTBEAT_TIMEOUT seconds,
+are handed to the remaining workers, without the hosts whose results were
+already received.
+
+Both sides prove they know the shared token with an HMAC of a nonce chosen
+by the other side, so the token itself is never sent. TCP workers always
+require a token; Unix socket workers without one rely on the permissions of
+the socket. Messages are not encrypted, so passwords are only sent to workers
+on Unix sockets or loopback addresses.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import secrets
+import socket
+from typing import Union, List, Tuple
+
+from ._ssh_orchestration import async_cmd_exec, iter_inv_hosts, new_host_result
+from ._transport_profiles import resolve_transport_profile
+
+# Environment variable holding the shared token of workers and coordinators.
+WORKER_TOKEN_ENV = "PY4OPS_WORKER_TOKEN"
+
+# Seconds between heartbeats of a worker, and of silence before it is considered dead.
+HEARTBEAT_INTERVAL = 10
+HEARTBEAT_TIMEOUT = 3 * HEARTBEAT_INTERVAL
+
+
+def parse_worker_address(address: str) -> Tuple[str, Union[int, None]]:
+    """Parse a worker address given as host:port or unix:/path/to/socket.
+
+    Return (host, port) for TCP addresses and (path, None) for Unix sockets.
+    """
+
+    if address.startswith("unix:"):
+        return address[len("unix:"):], None
+
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"Worker address must be host:port or unix:/path. Found: {address}")
+
+    return host.strip("[]") or "127.0.0.1", int(port)
+
+def is_loopback_address(address: str) -> bool:
+    """Check if a worker address is a Unix socket or a loopback TCP address."""
+
+    host, port = parse_worker_address(address)
+    if port is None or host == "localhost":
+        return True
+
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def auth_mac(token: Union[str, None], role: str, nonce: str) -> Union[str, None]:
+    """Return the HMAC proving the knowledge of token for a nonce, or None without a token."""
+
+    if not token:
+        return None
+    return hmac.new(token.encode("utf8"), f"py4ops-{role}:{nonce}".encode("utf8"), hashlib.sha256).hexdigest()
+
+def is_valid_mac(token: Union[str, None], role: str, nonce: str, mac) -> bool:
+    """Check the HMAC sent by the other side for a nonce."""
+
+    if not token:
+        return True
+    return isinstance(mac, str) and hmac.compare_digest(mac, auth_mac(token, role, nonce))
+
+def enable_keepalive(writer: asyncio.StreamWriter):
+    """Enable TCP keepalive on the socket of a connection."""
+
+    sock = writer.get_extra_info("socket")
+    if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+async def open_worker_connection(address: str):
+    """Open a connection to a worker."""
+
+    host, port = parse_worker_address(address)
+    if port is None:
+        return await asyncio.open_unix_connection(path=host)
+    reader, writer = await asyncio.open_connection(host, port)
+    enable_keepalive(writer)
+    return reader, writer
+
+async def send_message(writer: asyncio.StreamWriter, msg: dict):
+    """Send a single message."""
+
+    writer.write(json.dumps(msg).encode("utf8") + b"\n")
+    await writer.drain()
+
+async def recv_message(reader: asyncio.StreamReader, timeout: Union[float, None]=None) -> dict:
+    """Receive a single message, raising ConnectionError after timeout seconds of silence."""
+
+    try:
+        line = await asyncio.wait_for(reader.readline(), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise ConnectionError(f"No message received for {timeout} seconds.")
+    if not line:
+        raise ConnectionError("Connection closed by peer.")
+    return json.loads(line)
+
+def split_shards(hosts: list, shard_size: int) -> List[list]:
+    """Split a list of hosts into shards of at most shard_size hosts."""
+
+    if shard_size < 1:
+        raise ValueError("The shard size must be at least 1.")
+    return [hosts[i:i + shard_size] for i in range(0, len(hosts), shard_size)]
+
+async def run_shard(msg: dict, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+    """Execute a shard on the worker and stream per-host results back."""
+
+    shard_id = msg["shard_id"]
+    params = msg["params"]
+
+    async def run_host(index, vm_name, ip, transport_profile):
+        try:
+            result = await async_cmd_exec(
+                ip,
+                params["cmd_list"],
+                params["user"],
+                params["password"],
+                params["conn_timeout"],
+                params["exec_timeout"],
+                params["strict"],
+                params["check_ssh_conn"],
+                vm_name,
+                log_to_console=params["log_to_console"],
+                log_to_file=params["log_to_file"],
+                transport_profile=transport_profile,
+                output_filter=params["output_filter"]
+                )
+        except Exception as e:
+            result = new_host_result(ip, vm_name)
+            result["ok"] = False
+            result["error"] = str(e)
+        async with write_lock:
+            await send_message(writer, {"type": "result", "shard_id": shard_id, "index": index, "result": result})
+
+    await asyncio.gather(*[run_host(index, *host) for index, host in enumerate(msg["hosts"])])
+
+    async with write_lock:
+        await send_message(writer, {"type": "done", "shard_id": shard_id})
+
+async def serve_worker(address: str, token: Union[str, None]=None):
+    """Serve shards sent by a coordinator until cancelled.
+
+    Coordinators must prove they know token by answering a challenge.
+    Listening on a TCP address requires a token, Unix sockets are only
+    accessible to the user running the worker.
+    """
+
+    host, port = parse_worker_address(address)
+    if not token and port is not None:
+        raise ValueError(f"Refusing to listen on {address} without a token, use a Unix socket.")
+
+    async def heartbeat(writer, write_lock):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            async with write_lock:
+                await send_message(writer, {"type": "heartbeat"})
+
+    async def handle(reader, writer):
+        write_lock = asyncio.Lock()
+        heartbeat_task = None
+        try:
+            nonce = secrets.token_hex(16)
+            await send_message(writer, {"type": "challenge", "nonce": nonce})
+            hello = await recv_message(reader, timeout=HEARTBEAT_TIMEOUT)
+            if hello.get("type") != "hello" or not is_valid_mac(token, "coordinator", nonce, hello.get("mac")):
+                print("Rejected coordinator with an invalid token.")
+                await send_message(writer, {"type": "error", "error": "Invalid token."})
+                return
+            await send_message(writer, {"type": "ready", "mac": auth_mac(token, "worker", str(hello.get("nonce")))})
+            heartbeat_task = asyncio.ensure_future(heartbeat(writer, write_lock))
+
+            while True:
+                try:
+                    msg = await recv_message(reader)
+                except ConnectionError:
+                    break
+                if msg.get("type") == "shard":
+                    print(f"Received shard {msg['shard_id']} with {len(msg['hosts'])} hosts")
+                    await run_shard(msg, writer, write_lock)
+        except (ConnectionError, OSError, ValueError) as e:
+            print(f"Coordinator connection lost: {e}")
+        finally:
+            if heartbeat_task is not None:
+                heartbeat_task.cancel()
+            writer.close()
+
+    if port is None:
+        # The socket is created without permissions for other users.
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(handle, path=host)
+        finally:
+            os.umask(umask)
+    else:
+        server = await asyncio.start_server(handle, host, port)
+        for sock in server.sockets:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    print(f"Worker listening on {address}")
+    async with server:
+        await server.serve_forever()
+
+async def exec_distributed_pipeline(
+    inv: Union[str, dict, list],
+    workers: List[str],
+    user: str,
+    password: str,
+    conn_timeout: Union[int, None],
+    exec_timeout: Union[int, None],
+    cmd_list: Union[str, List[str]],
+    strict=True,
+    check_ssh_conn=True,
+    log_to_console=True,
+    log_to_file=False,
+    shard_size: Union[int, None]=None,
+    transport_profile: Union[str, None]=None,
+    host_transport_profiles: Union[dict, None]=None,
+    output_filter: Union[dict, None]=None,
+    token: Union[str, None]=None,
+    ) -> List[dict]:
+    """Run the commands by splitting the inventory across worker processes.
+
+    token is the shared token of the workers. Return the list of per-host
+    results in the order they were received.
+    """
+
+    if not workers:
+        raise ValueError("At least one worker address is required.")
+
+    if password:
+        remote_workers = [address for address in workers if not is_loopback_address(address)]
+        if remote_workers:
+            raise ValueError(f"Refusing to send the password unencrypted to non-loopback workers: {', '.join(remote_workers)}")
+
+    hosts = [
+        [vm_name, ip, resolve_transport_profile(ip, transport_profile, host_transport_profiles)]
+        for vm_name, ip in iter_inv_hosts(inv)
+    ]
+    if shard_size is None:
+        shard_size = max(1, -(-len(hosts) // len(workers)))
+
+    params = {
+        "user": user,
+        "password": password,
+        "conn_timeout": conn_timeout,
+        "exec_timeout": exec_timeout,
+        "cmd_list": cmd_list,
+        "strict": strict,
+        "check_ssh_conn": check_ssh_conn,
+        "log_to_console": log_to_console,
+        "log_to_file": log_to_file,
+        "output_filter": output_filter,
+    }
+
+    queue = asyncio.Queue()
+    for shard_id, shard in enumerate(split_shards(hosts, shard_size)):
+        queue.put_nowait((shard_id, shard))
+
+    results = []
+
+    async def drive(address):
+        try:
+            reader, writer = await open_worker_connection(address)
+        except OSError as e:
+            print(f"Cannot connect to worker {address}: {e}")
+            return
+
+        nonce = secrets.token_hex(16)
+        try:
+            challenge = await recv_message(reader, timeout=HEARTBEAT_TIMEOUT)
+            mac = auth_mac(token, "coordinator", str(challenge.get("nonce")))
+            await send_message(writer, {"type": "hello", "mac": mac, "nonce": nonce})
+            reply = await recv_message(reader, timeout=HEARTBEAT_TIMEOUT)
+        except (ConnectionError, OSError, ValueError) as e:
+            reply = {"type": "error", "error": str(e)}
+        if reply.get("type") == "ready" and not is_valid_mac(token, "worker", nonce, reply.get("mac")):
+            reply = {"type": "error", "error": "The worker does not know the token."}
+        if reply.get("type") != "ready":
+            print(f"Worker {address} refused the connection: {reply.get('error')}")
+            writer.close()
+            return
+
+        try:
+            while True:
+                shard_id, shard = await queue.get()
+                remaining = set(range(len(shard)))
+                try:
+                    await send_message(writer, {"type": "shard", "shard_id": shard_id, "hosts": shard, "params": params})
+                    while True:
+                        # A worker that lost power or was partitioned stops sending heartbeats.
+                        msg = await recv_message(reader, timeout=HEARTBEAT_TIMEOUT)
+                        if msg["type"] == "done":
+                            break
+                        if msg["type"] == "result" and msg["index"] in remaining:
+                            remaining.discard(msg["index"])
+                            result = msg["result"]
+                            results.append(result)
+                            status = "success" if result["ok"] else "failed"
+                            print(f"[{address}] Command {status} for -> {result['ip']} - {result['vm_name']}")
+                            if log_to_console:
+                                for output in result["outputs"]:
+                                    print(output["stdout"])
+                except (ConnectionError, OSError, ValueError) as e:
+                    print(f"Worker {address} died: {e}, reassigning {len(remaining)} hosts of shard {shard_id}...")
+                    if remaining:
+                        queue.put_nowait((shard_id, [shard[i] for i in sorted(remaining)]))
+                    queue.task_done()
+                    return
+                queue.task_done()
+        finally:
+            writer.close()
+
+    join_task = asyncio.ensure_future(queue.join())
+    drivers = asyncio.ensure_future(asyncio.gather(*[drive(address) for address in workers]))
+    await asyncio.wait({join_task, drivers}, return_when=asyncio.FIRST_COMPLETED)
+
+    if not join_task.done():
+        join_task.cancel()
+        unassigned = 0
+        while not queue.empty():
+            unassigned += len(queue.get_nowait()[1])
+        msg = f"All workers are unavailable, {unassigned} hosts were not executed."
+        if strict:
+            raise ConnectionError(msg)
+        print(msg)
+
+    drivers.cancel()
+    try:
+        await drivers
+    except asyncio.CancelledError:
+        pass
+
+    return results
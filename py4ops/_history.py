@@ -0,0 +1,67 @@
+"""Per-host duration history module.
+
+Durations of previous runs are kept in a small JSON file so that the
+executor can start historically slow hosts first (longest processing time
+first scheduling) when the concurrency is bounded.
+"""
+
+import json
+import os
+from typing import List, Tuple, Union
+
+DEFAULT_HISTORY_FILE = os.path.join(os.path.expanduser("~"), ".py4ops", "history.json")
+
+# Weight of the latest run in the moving average of a host duration.
+HISTORY_ALPHA = 0.3
+
+
+def load_history(path: str) -> dict:
+    """Load the duration history as {ip: {"runs": int, "mean": float}}."""
+
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path, "r") as f:
+            history = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read history file {path}: {e}, ignoring...")
+        return {}
+
+    if not isinstance(history, dict):
+        return {}
+    return history
+
+def save_history(path: str, history: dict):
+    """Save the duration history atomically."""
+
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(history, f)
+    os.replace(tmp_path, path)
+
+def record_duration(history: dict, ip: str, duration: float):
+    """Update the moving average duration of a host."""
+
+    stats = history.get(ip)
+    if stats is None:
+        history[ip] = {"runs": 1, "mean": duration}
+        return
+
+    stats["runs"] += 1
+    stats["mean"] = HISTORY_ALPHA * duration + (1 - HISTORY_ALPHA) * stats["mean"]
+
+def order_by_history(hosts: List[Tuple[Union[str, None], str]], history: dict) -> List[Tuple[Union[str, None], str]]:
+    """Order (vm_name, ip) pairs so that historically slow hosts come first.
+
+    Hosts without history are estimated with the average of the known hosts.
+    """
+
+    known = [history[ip]["mean"] for _, ip in hosts if ip in history]
+    default = sum(known) / len(known) if known else 0.0
+
+    return sorted(hosts, key=lambda host: history.get(host[1], {}).get("mean", default), reverse=True)
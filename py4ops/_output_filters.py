@@ -0,0 +1,198 @@
+"""Remote output filtering and compression module.
+
+An output filter wraps a command so that its stdout is reduced on the
+remote host (grep, head, tail and byte limits) and optionally compressed
+before it is sent to the controller, which decompresses it as a stream.
+The exit code of the wrapped command is preserved, except for the SIGPIPE
+exit code when a head or byte limit stops reading early. When the command
+succeeds, or is killed by SIGPIPE, but a reducer or the compressor fails,
+such as an invalid grep pattern or a missing zstd binary, the exit code is
+FILTER_ERROR_EXIT_CODE.
+"""
+
+import asyncio
+import shlex
+import zlib
+from collections import namedtuple
+from typing import Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS = ("gzip", "zstd", "auto")
+
+# Exit code of a command killed by SIGPIPE when a reducer stops reading early.
+SIGPIPE_EXIT_CODE = 141
+
+# Exit code of a successful command whose output filter failed.
+FILTER_ERROR_EXIT_CODE = 125
+
+READ_CHUNK_SIZE = 64 * 1024
+
+FilteredResult = namedtuple("FilteredResult", ["returncode", "stdout", "stderr"])
+
+
+def make_output_filter(
+    grep: Union[str, None]=None,
+    head: Union[int, None]=None,
+    tail: Union[int, None]=None,
+    max_bytes: Union[int, None]=None,
+    compress: Union[str, None]=None,
+    ) -> Union[dict, None]:
+    """Return an output filter, or None when nothing is reduced or compressed."""
+
+    if compress is not None and compress not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compress}. Available: {', '.join(COMPRESSIONS)}")
+    if compress == "zstd" and zstandard is None:
+        raise ValueError("zstd compression requires the zstandard package.")
+    for name, value in (("head", head), ("tail", tail), ("max_bytes", max_bytes)):
+        if value is not None and value < 0:
+            raise ValueError(f"{name} must be a positive number.")
+
+    output_filter = {"grep": grep, "head": head, "tail": tail, "max_bytes": max_bytes, "compress": compress}
+    if all(value is None for value in output_filter.values()):
+        return None
+    return output_filter
+
+def build_filtered_cmd(cmd: str, output_filter: dict) -> str:
+    """Wrap a command with the remote reducers and compressor of an output filter."""
+
+    # (reducer, exit codes meaning success, whether it stops reading early)
+    reducers = []
+    if output_filter.get("grep") is not None:
+        # grep exits with 1 when no line matches.
+        reducers.append((f"grep -E -- {shlex.quote(output_filter['grep'])}", [0, 1], False))
+    if output_filter.get("head") is not None:
+        reducers.append((f"head -n {int(output_filter['head'])}", [0], True))
+    if output_filter.get("tail") is not None:
+        reducers.append((f"tail -n {int(output_filter['tail'])}", [0], False))
+    if output_filter.get("max_bytes") is not None:
+        reducers.append((f"head -c {int(output_filter['max_bytes'])}", [0], True))
+
+    compress = output_filter.get("compress")
+    if compress == "gzip":
+        reducers.append(("gzip -c", [0], False))
+    elif compress == "zstd":
+        reducers.append(("zstd -c -q", [0], False))
+    elif compress == "auto":
+        if zstandard is not None:
+            reducers.append(("if command -v zstd >/dev/null 2>&1; then zstd -c -q; else gzip -c; fi", [0], False))
+        else:
+            reducers.append(("gzip -c", [0], False))
+
+    if not reducers:
+        return cmd
+
+    # head stops reading early, which kills cmd and the reducers before it with SIGPIPE.
+    stops_early = [any(early for _, _, early in reducers[index + 1:]) for index in range(len(reducers))]
+    mask_sigpipe = f"[ \"$rc\" -eq {SIGPIPE_EXIT_CODE} ] && rc=0; " if any(early for _, _, early in reducers) else ""
+
+    # The exit codes of cmd and of the failed reducers are passed through fd 4
+    # as "c<code>" and "f<code>" lines, so the pipeline does not hide them. A
+    # failed reducer also kills cmd with SIGPIPE.
+    stages = []
+    for (reducer, ok_codes, _), before_head in zip(reducers, stops_early):
+        if before_head:
+            ok_codes = ok_codes + [SIGPIPE_EXIT_CODE]
+        error = shlex.quote(f"py4ops: output filter failed: {reducer}, exit code")
+        stages.append(
+            f"{{ {reducer}; s=$?; case $s in {'|'.join(str(code) for code in ok_codes)}) ;; "
+            f"*) echo f$s >&4; echo {error} $s >&2;; esac; }}"
+        )
+    pipeline = " | ".join(stages)
+
+    return (
+        f"{{ st=$( {{ {{ ( {cmd}\n ) 3>&- 4>&-; echo c$? >&4; }} | {{ {pipeline}; }} >&3; }} 4>&1 ); "
+        f"rc=0; failed=0; for s in $st; do case $s in c*) rc=${{s#c}};; f*) failed=1;; esac; done; "
+        f"{mask_sigpipe}[ $failed -eq 1 ] && {{ [ $rc -eq 0 ] || [ $rc -eq {SIGPIPE_EXIT_CODE} ]; }} && rc={FILTER_ERROR_EXIT_CODE}; "
+        f"exit $rc; }} 3>&1"
+    )
+
+class StreamDecompressor:
+    """Incremental decompressor detecting gzip or zstd from the stream header."""
+
+    def __init__(self, compress: Union[str, None]):
+        self._compress = compress
+        self._decompressor = None
+        self._header = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Decompress a chunk of the stream."""
+
+        if not self._compress:
+            return chunk
+
+        if self._decompressor is None:
+            self._header += chunk
+            if len(self._header) < 4:
+                return b""
+            chunk, self._header = self._header, b""
+            if chunk.startswith(b"\x28\xb5\x2f\xfd"):
+                if zstandard is None:
+                    raise ValueError("Received zstd output but the zstandard package is not installed.")
+                self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+            else:
+                self._decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+
+        return self._decompressor.decompress(chunk)
+
+    def flush(self) -> bytes:
+        """Return the end of the stream."""
+
+        if not self._compress:
+            return b""
+        if self._decompressor is None:
+            # Streams shorter than the header are empty or truncated.
+            return b""
+        if hasattr(self._decompressor, "flush"):
+            return self._decompressor.flush()
+        return b""
+
+def read_filtered_output(stream, output_filter: dict) -> bytes:
+    """Read and decompress the stdout of a filtered command from a paramiko channel file."""
+
+    decompressor = StreamDecompressor(output_filter.get("compress"))
+    output = []
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        output.append(decompressor.feed(chunk))
+    output.append(decompressor.flush())
+
+    return b"".join(output)
+
+async def async_run_filtered(
+    client,
+    cmd: str,
+    output_filter: dict,
+    exec_timeout: Union[int, None]=None,
+    **session_options,
+    ) -> FilteredResult:
+    """Run a filtered command on an asyncssh connection and decompress its stdout as a stream."""
+
+    async def run():
+        process = await client.create_process(build_filtered_cmd(cmd, output_filter), encoding=None, **session_options)
+        decompressor = StreamDecompressor(output_filter.get("compress"))
+
+        async def read_stdout():
+            output = []
+            while True:
+                chunk = await process.stdout.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                output.append(decompressor.feed(chunk))
+            output.append(decompressor.flush())
+            return b"".join(output)
+
+        stdout, stderr = await asyncio.gather(read_stdout(), process.stderr.read())
+        completed = await process.wait()
+        return FilteredResult(
+            completed.exit_status,
+            str(stdout, "utf8", errors="replace"),
+            str(stderr, "utf8", errors="replace"),
+            )
+
+    return await asyncio.wait_for(run(), timeout=exec_timeout)
@@ -0,0 +1,38 @@
+"""Rolling execution module.
+
+Batch sizes and failure thresholds are given as a count of hosts, or as a
+percentage string such as "25%".
+"""
+
+import math
+from typing import List, Union
+
+
+def resolve_count(value: Union[int, str], total: int) -> int:
+    """Resolve a count or a percentage of total to a number of hosts."""
+
+    if isinstance(value, str):
+        value = value.strip()
+        if value.endswith("%"):
+            percent = float(value[:-1])
+            if percent < 0 or percent > 100:
+                raise ValueError(f"The percentage must be between 0% and 100%. Found: {value}")
+            return math.ceil(total * percent / 100)
+        value = int(value)
+
+    if value < 0:
+        raise ValueError(f"The count must be a positive number. Found: {value}")
+    return value
+
+def split_batches(hosts: list, batch_size: Union[int, str]) -> List[list]:
+    """Split hosts into rolling batches of batch_size hosts."""
+
+    size = max(1, resolve_count(batch_size, len(hosts)))
+    return [hosts[i:i + size] for i in range(0, len(hosts), size)]
+
+def is_failure_limit_exceeded(failures: int, executed: int, max_failures: Union[int, str, None]) -> bool:
+    """Return True when failures exceed max_failures of the executed hosts."""
+
+    if max_failures is None:
+        return False
+    return failures > resolve_count(max_failures, executed)
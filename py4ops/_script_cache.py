@@ -0,0 +1,74 @@
+"""Content-addressed script cache module.
+
+A local script is stored on each host under its sha256 digest, so it is
+uploaded only to hosts where that digest is missing. Repeated runs only
+cost a single stat check per host before the script is executed.
+"""
+
+import hashlib
+import posixpath
+import shlex
+from typing import Dict, List, Tuple, Union
+
+# Relative to the home directory of the remote user.
+DEFAULT_REMOTE_CACHE_DIR = ".cache/py4ops/scripts"
+
+
+def read_script(path: str) -> Tuple[bytes, str]:
+    """Read a local script and return its content and sha256 digest."""
+
+    with open(path, "rb") as f:
+        content = f.read()
+
+    return content, hashlib.sha256(content).hexdigest()
+
+def remote_script_path(digest: str, cache_dir: str=DEFAULT_REMOTE_CACHE_DIR) -> str:
+    """Return the path of a script in the remote cache directory."""
+
+    return posixpath.join(cache_dir, digest)
+
+def build_check_cmd(remote_path: str) -> str:
+    """Return the command checking if a script is in the remote cache."""
+
+    return f"test -x {shlex.quote(remote_path)}"
+
+def build_upload_cmd(remote_path: str) -> str:
+    """Return the command storing the script read from stdin in the remote cache."""
+
+    cache_dir = shlex.quote(posixpath.dirname(remote_path))
+    path = shlex.quote(remote_path)
+    tmp_path = f"{path}.tmp.$$"
+
+    return f"mkdir -p {cache_dir} && cat > {tmp_path} && chmod 700 {tmp_path} && mv -f {tmp_path} {path}"
+
+def build_exec_cmd(
+    remote_path: str,
+    args: Union[List[str], None]=None,
+    env: Union[Dict[str, str], None]=None,
+    ) -> str:
+    """Return the command executing a cached script with arguments and environment."""
+
+    parts = []
+    if env:
+        parts.append("env")
+        parts.extend(shlex.quote(f"{key}={value}") for key, value in env.items())
+
+    path = remote_path if posixpath.isabs(remote_path) else posixpath.join(".", remote_path)
+    parts.append(shlex.quote(path))
+
+    if args:
+        parts.extend(shlex.quote(arg) for arg in args)
+
+    return " ".join(parts)
+
+def parse_script_env(env_list: Union[List[str], None]) -> Dict[str, str]:
+    """Parse a list of KEY=VALUE strings."""
+
+    env = {}
+    for item in env_list or []:
+        key, sep, value = item.partition("=")
+        if not sep or not key:
+            raise ValueError(f"Environment variables must be given as KEY=VALUE. Found: {item}")
+        env[key] = value
+
+    return env
@@ -2,7 +2,9 @@
 
 import subprocess
 import asyncio
+import contextlib
 import os
+import time
 from typing import Union, List
 import yaml
 
@@ -10,6 +12,12 @@ import paramiko
 import asyncssh
 
 from ._checkers import is_valid_ip_address, is_valid_ipv4_address, is_valid_ipv6_address, check_ssh
+from ._script_cache import read_script, remote_script_path, build_check_cmd, build_upload_cmd, build_exec_cmd, DEFAULT_REMOTE_CACHE_DIR
+from ._transport_profiles import asyncssh_connect_options, asyncssh_session_options, paramiko_connect_options, apply_paramiko_session_options, resolve_transport_profile
+from ._output_filters import build_filtered_cmd, read_filtered_output, async_run_filtered
+from ._compact_inventory import CompactInventory
+from ._history import load_history, save_history, record_duration, order_by_history
+from ._rolling import split_batches, is_failure_limit_exceeded
 
 
 
@@ -99,8 +107,18 @@ def get_all_hosts_from_yaml_list(yaml_list: list) -> dict:
             
     return merged_all_hosts
 
-def inv_import(inv: Union[str, dict, list, object]):
-    """Retrieve the type of the inventory and Return Inventory for operations."""
+def inv_import(inv: Union[str, dict, list, object], compact=False):
+    """Retrieve the type of the inventory and Return Inventory for operations.
+    
+    When compact is True, return a CompactInventory storing the addresses as
+    packed integers, for huge fleets.
+    """
+    
+    if isinstance(inv, CompactInventory):
+        return inv
+    
+    if compact:
+        return CompactInventory.from_inv(inv)
     
     # Check if the inventory is a string
     if isinstance(inv, str):
@@ -161,6 +179,174 @@ def inv_import(inv: Union[str, dict, list, object]):
     else:
         raise TypeError("The inventory must be a dictionary, a list or a string.")
     
+def iter_inv_hosts(inv: Union[str, dict, list, CompactInventory]):
+    """Yield (vm_name, ip) pairs from an imported inventory."""
+    
+    if isinstance(inv, dict):
+        yield from inv.items()
+    elif isinstance(inv, list):
+        for ip in inv:
+            yield None, ip
+    elif isinstance(inv, str):
+        yield None, inv
+    elif isinstance(inv, CompactInventory):
+        yield from inv
+    else:
+        raise TypeError(f"The inventory must be a dictionary, a list or a string. Found: {type(inv)}")
+    
+def new_host_result(ip: str, vm_name: Union[str, None]=None) -> dict:
+    """Return an empty per-host result."""
+    
+    return {"ip": ip, "vm_name": vm_name, "ok": True, "error": None, "outputs": []}
+
+def add_cmd_output(host_result: dict, cmd: str, returncode: Union[int, None], stdout: str, stderr: str):
+    """Record the output of a single command in a per-host result."""
+    
+    host_result["outputs"].append({"cmd": cmd, "returncode": returncode, "stdout": stdout, "stderr": stderr})
+    if returncode != 0:
+        host_result["ok"] = False
+    
+async def feed_tasks(hosts, host_exec, max_concurrency: Union[int, None]=None):
+    """Run host_exec(vm_name, ip) over hosts and yield results as they complete.
+    
+    Hosts are pulled lazily, so a coroutine is only created when one of the
+    max_concurrency execution slots is free. No new host is started while the
+    consumer is not asking for results. Unfinished tasks are cancelled when
+    the generator is closed.
+    """
+    
+    hosts = iter(hosts)
+    in_flight = set()
+    try:
+        while True:
+            while max_concurrency is None or len(in_flight) < max_concurrency:
+                host = next(hosts, None)
+                if host is None:
+                    break
+                in_flight.add(asyncio.ensure_future(host_exec(*host)))
+                
+            if not in_flight:
+                return
+            
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in in_flight:
+            task.cancel()
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+    
+class AsyncResultIterator:
+    """Async iterator over per-host results that can cancel the rest of the run.
+    
+    Each result is awaited in its own task, so cancel() also works from a
+    task other than the one iterating.
+    """
+    
+    def __init__(self, results):
+        self._results = results
+        self._next = None
+        self._cancelled = False
+        
+    def __aiter__(self):
+        return self
+    
+    async def _next_result(self) -> dict:
+        return await self._results.__anext__()
+    
+    async def __anext__(self) -> dict:
+        if self._cancelled:
+            raise StopAsyncIteration
+        
+        self._next = asyncio.ensure_future(self._next_result())
+        try:
+            # asyncio.wait leaves the task running when the consumer is cancelled.
+            await asyncio.wait({self._next})
+        except asyncio.CancelledError:
+            self._next.cancel()
+            await asyncio.wait({self._next})
+            raise
+        finally:
+            next_task, self._next = self._next, None
+        
+        if next_task.cancelled():
+            # Cancelled by cancel() from another task.
+            raise StopAsyncIteration
+        return next_task.result()
+    
+    async def cancel(self):
+        """Cancel the hosts that are still running or waiting to start."""
+        
+        self._cancelled = True
+        if self._next is not None:
+            self._next.cancel()
+            await asyncio.wait({self._next})
+        await self._results.aclose()
+        
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.cancel()
+    
+@contextlib.asynccontextmanager
+async def reuse_connection(client):
+    """Yield an already opened connection without closing it."""
+    
+    yield client
+    
+# Seconds between keepalives of prefetched connections, and unanswered
+# keepalives before they are closed.
+PREFETCH_KEEPALIVE_INTERVAL = 15
+PREFETCH_KEEPALIVE_COUNT_MAX = 3
+
+def async_connect(
+    ip: str,
+    user: Union[str, None]=None,
+    password: Union[str, None]=None,
+    transport_profile: Union[str, None]=None,
+    client=None,
+    ):
+    """Return an async context manager yielding an asyncssh connection, reusing client when given."""
+    
+    if client is not None:
+        return reuse_connection(client)
+    return asyncssh.connect(host=ip, username=user, password=password, **asyncssh_connect_options(transport_profile))
+
+async def open_prefetched_connection(
+    ip: str,
+    user: Union[str, None]=None,
+    password: Union[str, None]=None,
+    transport_profile: Union[str, None]=None,
+    conn_timeout: Union[int, None]=None,
+    ):
+    """Open a connection ahead of its use, returning None on failure so the host connects again itself.
+    
+    Keepalives are sent while the connection waits, so that a connection
+    dropped by the server or a NAT is closed instead of hanging.
+    """
+    
+    try:
+        client = await asyncio.wait_for(
+            asyncssh.connect(host=ip, username=user, password=password, **asyncssh_connect_options(transport_profile)),
+            timeout=conn_timeout
+            )
+    except Exception:
+        return None
+    client.set_keepalive(PREFETCH_KEEPALIVE_INTERVAL, PREFETCH_KEEPALIVE_COUNT_MAX)
+    return client
+    
+async def close_prefetched_connections(tasks):
+    """Cancel or close connections opened ahead of their use."""
+    
+    tasks = [task for task in tasks if task is not None]
+    for task in tasks:
+        task.cancel()
+    for client in await asyncio.gather(*tasks, return_exceptions=True):
+        if client is not None and not isinstance(client, BaseException):
+            client.close()
+    
 def sync_cmd_exec(
     ip: str,
     cmd: Union[str, List[str]],
@@ -173,6 +359,8 @@ def sync_cmd_exec(
     vm_name=None,
     log_to_console=True,
     log_to_file=False,
+    transport_profile: Union[str, None]=None,
+    output_filter: Union[dict, None]=None,
     ):
     """Execute a command synchronously."""
     
@@ -189,13 +377,14 @@ def sync_cmd_exec(
             with paramiko.SSHClient() as client:
                 client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
                 client.load_system_host_keys()
-                client.connect(hostname=ip, username=user, password=password, timeout=conn_timeout)
+                client.connect(hostname=ip, username=user, password=password, timeout=conn_timeout, **paramiko_connect_options(transport_profile))
+                apply_paramiko_session_options(client, transport_profile)
                 print("Executing commands for", ip)
-                (stdin, stdout, stderr) = client.exec_command(cmd, timeout=exec_timeout)
+                (stdin, stdout, stderr) = client.exec_command(build_filtered_cmd(cmd, output_filter) if output_filter else cmd, timeout=exec_timeout)
                 
                 if log_to_console:
-                    output = stdout.read()
-                    print(str(output, 'utf8'))
+                    output = read_filtered_output(stdout, output_filter) if output_filter else stdout.read()
+                    print(str(output, 'utf8', errors='replace'))
         except Exception as e:
             print(f"Error executing command on {ip}: {e}")
             if strict:
@@ -207,13 +396,14 @@ def sync_cmd_exec(
                 with paramiko.SSHClient() as client:
                     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
                     client.load_system_host_keys()
-                    client.connect(hostname=ip, username=user, password=password)
+                    client.connect(hostname=ip, username=user, password=password, **paramiko_connect_options(transport_profile))
+                    apply_paramiko_session_options(client, transport_profile)
                     print("Executing commands for", ip)
-                    (stdin, stdout, stderr) = client.exec_command(c, timeout=exec_timeout)
+                    (stdin, stdout, stderr) = client.exec_command(build_filtered_cmd(c, output_filter) if output_filter else c, timeout=exec_timeout)
                     
                     if log_to_console:
-                        output = stdout.read()
-                        print(str(output, 'utf8'))
+                        output = read_filtered_output(stdout, output_filter) if output_filter else stdout.read()
+                        print(str(output, 'utf8', errors='replace'))
             except Exception as e:
                 print(f"Error executing command on {ip}: {e}")
                 if strict:
@@ -234,8 +424,16 @@ async def async_cmd_exec(
     vm_name=None,
     log_to_console=True,
     log_to_file=False,
+    transport_profile: Union[str, None]=None,
+    output_filter: Union[dict, None]=None,
+    client=None,
     ):
-    """Execute a command asynchronously."""
+    """Execute a command asynchronously and return the host result.
+    
+    When client is given, the commands run on that open connection.
+    """
+    
+    host_result = new_host_result(ip, vm_name)
     
     if check_ssh_conn:
         if check_ssh(server_ip=ip, timeout=conn_timeout) is False:
@@ -243,15 +441,21 @@ async def async_cmd_exec(
                 raise ConnectionError(f"Cannot connect to {ip}")
             else:
                 print(f"Cannot connect to {ip}, skipping...")
-                return
+                host_result["ok"] = False
+                host_result["error"] = f"Cannot connect to {ip}"
+                return host_result
             
     if isinstance(cmd, str):
         
         try:
-            async with asyncssh.connect(host=ip, username=user, password=password) as client:
+            async with async_connect(ip, user, password, transport_profile, client) as conn:
                 print("Executing commands for", ip)
-                result = await client.run(cmd, check=True, timeout=exec_timeout)
+                if output_filter:
+                    result = await async_run_filtered(conn, cmd, output_filter, exec_timeout, **asyncssh_session_options(transport_profile))
+                else:
+                    result = await conn.run(cmd, check=True, timeout=exec_timeout, **asyncssh_session_options(transport_profile))
                 stdout, stderr = result.stdout, result.stderr
+                add_cmd_output(host_result, cmd, result.returncode, stdout, stderr)
                 if result.returncode == 0:
                     print(f"Command success for -> {ip} - {vm_name}")
                     if log_to_console:
@@ -269,16 +473,22 @@ async def async_cmd_exec(
                         #error_file.write(f"Error for {ip} - {vm_name}\n")
         except Exception as e:
             print(f"Exception for {ip}: {e}")
+            host_result["ok"] = False
+            host_result["error"] = str(e)
             
             
     if isinstance(cmd, list):
         
         for c in cmd:
             try:
-                async with asyncssh.connect(host=ip, username=user, password=password) as client:
+                async with async_connect(ip, user, password, transport_profile, client) as conn:
                     print("Executing commands for", ip)
-                    result = await client.run(c, check=True, timeout=exec_timeout)
+                    if output_filter:
+                        result = await async_run_filtered(conn, c, output_filter, exec_timeout, **asyncssh_session_options(transport_profile))
+                    else:
+                        result = await conn.run(c, check=True, timeout=exec_timeout, **asyncssh_session_options(transport_profile))
                     stdout, stderr = result.stdout, result.stderr
+                    add_cmd_output(host_result, c, result.returncode, stdout, stderr)
                 if result.returncode == 0:
                     print(f"Command success for -> {ip} - {vm_name}")
                     if log_to_console:
@@ -297,10 +507,148 @@ async def async_cmd_exec(
 
             except Exception as e:
                 print(f"Exception for {ip}: {e}")
+                host_result["ok"] = False
+                host_result["error"] = str(e)
+                
+    return host_result
+                
+    
+def sync_script_exec(
+    ip: str,
+    script: bytes,
+    digest: str,
+    script_args: Union[List[str], None]=None,
+    script_env: Union[dict, None]=None,
+    user: Union[str, None]=None,
+    password: Union[str, None]=None,
+    conn_timeout: Union[int, None]=None,
+    exec_timeout: Union[int, None]=None,
+    strict=True,
+    check_ssh_conn=True,
+    vm_name=None,
+    log_to_console=True,
+    log_to_file=False,
+    cache_dir: str=DEFAULT_REMOTE_CACHE_DIR,
+    transport_profile: Union[str, None]=None,
+    output_filter: Union[dict, None]=None,
+    ):
+    """Upload a script if missing from the remote cache and execute it synchronously."""
+    
+    host_result = new_host_result(ip, vm_name)
+    
+    if check_ssh_conn:
+         if check_ssh(server_ip=ip, timeout=conn_timeout) is False:
+             if strict:
+                 raise ConnectionError(f"Cannot connect to {ip}")
+             else:
+                 print(f"Cannot connect to {ip}, skipping...")
+                 host_result["ok"] = False
+                 host_result["error"] = f"Cannot connect to {ip}"
+                 return host_result
+             
+    remote_path = remote_script_path(digest, cache_dir)
+    try:
+        with paramiko.SSHClient() as client:
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.load_system_host_keys()
+            client.connect(hostname=ip, username=user, password=password, timeout=conn_timeout, **paramiko_connect_options(transport_profile))
+            apply_paramiko_session_options(client, transport_profile)
+            
+            (stdin, stdout, stderr) = client.exec_command(build_check_cmd(remote_path), timeout=exec_timeout)
+            if stdout.channel.recv_exit_status() != 0:
+                print(f"Uploading script {digest[:12]} to {ip}")
+                (stdin, stdout, stderr) = client.exec_command(build_upload_cmd(remote_path), timeout=exec_timeout)
+                stdin.write(script)
+                stdin.channel.shutdown_write()
+                if stdout.channel.recv_exit_status() != 0:
+                    raise IOError(f"Cannot upload script: {str(stderr.read(), 'utf8')}")
                 
+            print("Executing script for", ip)
+            exec_cmd = build_exec_cmd(remote_path, script_args, script_env)
+            (stdin, stdout, stderr) = client.exec_command(build_filtered_cmd(exec_cmd, output_filter) if output_filter else exec_cmd, timeout=exec_timeout)
+            output = read_filtered_output(stdout, output_filter) if output_filter else stdout.read()
+            output, err_output = str(output, 'utf8', errors='replace'), str(stderr.read(), 'utf8', errors='replace')
+            add_cmd_output(host_result, exec_cmd, stdout.channel.recv_exit_status(), output, err_output)
+            
+            if log_to_console:
+                print(output)
+    except Exception as e:
+        print(f"Error executing script on {ip}: {e}")
+        if strict:
+            raise e
+        host_result["ok"] = False
+        host_result["error"] = str(e)
+        
+    return host_result
+    
+async def async_script_exec(
+    ip: str,
+    script: bytes,
+    digest: str,
+    script_args: Union[List[str], None]=None,
+    script_env: Union[dict, None]=None,
+    user: Union[str, None]=None,
+    password: Union[str, None]=None,
+    conn_timeout: Union[int, None]=None,
+    exec_timeout: Union[int, None]=None,
+    strict=True,
+    check_ssh_conn=True,
+    vm_name=None,
+    log_to_console=True,
+    log_to_file=False,
+    cache_dir: str=DEFAULT_REMOTE_CACHE_DIR,
+    transport_profile: Union[str, None]=None,
+    output_filter: Union[dict, None]=None,
+    client=None,
+    ):
+    """Upload a script if missing from the remote cache and execute it asynchronously.
+    
+    When client is given, the script runs on that open connection.
+    """
+    
+    host_result = new_host_result(ip, vm_name)
+    
+    if check_ssh_conn:
+        if check_ssh(server_ip=ip, timeout=conn_timeout) is False:
+            if strict:
+                raise ConnectionError(f"Cannot connect to {ip}")
+            else:
+                print(f"Cannot connect to {ip}, skipping...")
+                host_result["ok"] = False
+                host_result["error"] = f"Cannot connect to {ip}"
+                return host_result
+            
+    remote_path = remote_script_path(digest, cache_dir)
+    try:
+        async with async_connect(ip, user, password, transport_profile, client) as conn:
+            check = await conn.run(build_check_cmd(remote_path), check=False, timeout=exec_timeout)
+            if check.returncode != 0:
+                print(f"Uploading script {digest[:12]} to {ip}")
+                await conn.run(build_upload_cmd(remote_path), input=script, encoding=None, check=True, timeout=exec_timeout)
+                
+            print("Executing script for", ip)
+            exec_cmd = build_exec_cmd(remote_path, script_args, script_env)
+            if output_filter:
+                result = await async_run_filtered(conn, exec_cmd, output_filter, exec_timeout, **asyncssh_session_options(transport_profile))
+            else:
+                result = await conn.run(exec_cmd, check=False, timeout=exec_timeout, **asyncssh_session_options(transport_profile))
+            add_cmd_output(host_result, exec_cmd, result.returncode, result.stdout, result.stderr)
+            
+        if result.returncode == 0:
+            print(f"Command success for -> {ip} - {vm_name}")
+            if log_to_console:
+                print(result.stdout)
+        else:
+            print(f"Error executing script for {ip} - {vm_name}:")
+    except Exception as e:
+        print(f"Exception for {ip}: {e}")
+        host_result["ok"] = False
+        host_result["error"] = str(e)
+        
+    return host_result
     
 def exec_sync_main_pipeline(
-    inv: Union[str, dict, list],
+    inv: Union[str, dict, list, CompactInventory],
     user: str,
     password: str,
     conn_timeout: Union[int, None],
@@ -310,14 +658,31 @@ def exec_sync_main_pipeline(
     check_ssh_conn=True,
     log_to_console=True,
     log_to_file=False,
+    script: Union[str, None]=None,
+    script_args: Union[List[str], None]=None,
+    script_env: Union[dict, None]=None,
+    transport_profile: Union[str, None]=None,
+    host_transport_profiles: Union[dict, None]=None,
+    output_filter: Union[dict, None]=None,
     ):
-    """Run the commands synchronously."""
+    """Run the commands synchronously.
     
-    if isinstance(inv, dict):  
-        for vm_name, ip in inv.items():
-            sync_cmd_exec(
+    When script is given, the local script is uploaded to hosts missing it
+    from their cache and executed instead of cmd_list. transport_profile
+    selects the SSH transport profile of the run and host_transport_profiles
+    overrides it per host as {ip: profile}. output_filter, built with
+    make_output_filter, reduces and compresses the output on the hosts.
+    """
+    
+    if script is not None:
+        content, digest = read_script(script)
+        for vm_name, ip in iter_inv_hosts(inv):
+            sync_script_exec(
                 ip,
-                cmd_list,
+                content,
+                digest,
+                script_args,
+                script_env,
                 user,
                 password,
                 conn_timeout,
@@ -326,26 +691,13 @@ def exec_sync_main_pipeline(
                 check_ssh_conn,
                 vm_name,
                 log_to_console=True,
-                log_to_file=False
-                )
-                
-    elif isinstance(inv, list):
-        for ip in inv:
-            sync_cmd_exec(
-                ip,
-                cmd_list,
-                user,
-                password,
-                conn_timeout,
-                exec_timeout,
-                strict,
-                check_ssh_conn,
-                log_to_console,
-                log_to_file,
+                log_to_file=False,
+                transport_profile=resolve_transport_profile(ip, transport_profile, host_transport_profiles),
+                output_filter=output_filter
                 )
-                
-    elif isinstance(inv, str):
-        ip = inv
+        return
+    
+    for vm_name, ip in iter_inv_hosts(inv):
         sync_cmd_exec(
             ip,
             cmd_list,
@@ -355,15 +707,15 @@ def exec_sync_main_pipeline(
             exec_timeout,
             strict,
             check_ssh_conn,
+            vm_name,
             log_to_console=True,
-            log_to_file=False
+            log_to_file=False,
+            transport_profile=resolve_transport_profile(ip, transport_profile, host_transport_profiles),
+            output_filter=output_filter
             )
-        
-    else:
-        raise TypeError(f"The inventory must be a dictionary, a list or a string. Found: {type(inv)}")
     
-async def exec_async_main_pipeline(
-    inv: Union[str, dict, list],
+def iter_async_results(
+    inv: Union[str, dict, list, CompactInventory],
     user: str,
     password: str,
     conn_timeout: Union[int, None],
@@ -373,17 +725,55 @@ async def exec_async_main_pipeline(
     check_ssh_conn=True,
     log_to_console=True,
     log_to_file=False,
-    ):
-    """Run the commands synchronously."""
+    max_concurrency: Union[int, None]=None,
+    history_file: Union[str, None]=None,
+    script: Union[str, None]=None,
+    script_args: Union[List[str], None]=None,
+    script_env: Union[dict, None]=None,
+    transport_profile: Union[str, None]=None,
+    host_transport_profiles: Union[dict, None]=None,
+    output_filter: Union[dict, None]=None,
+    batch_size: Union[int, str, None]=None,
+    max_failures: Union[int, str, None]=None,
+    keep_outputs=True,
+    ) -> AsyncResultIterator:
+    """Run the commands asynchronously and iterate over per-host results as each host completes.
+    
+    Takes the same arguments as exec_async_main_pipeline. Backpressure only
+    applies with max_concurrency: no new host is started while the consumer
+    is busy with a result. Without it, every host starts at once. Leaving the
+    async with block or calling cancel(), from any task, cancels the rest of
+    the run:
+    
+        async with iter_async_results(inv, user, password, 10, 10, ["uptime"], max_concurrency=50) as results:
+            async for result in results:
+                if result["ok"]:
+                    break
+    """
+    
+    if max_failures is not None and batch_size is None:
+        raise ValueError("max_failures requires batch_size.")
     
-    tasks = []
+    async def host_results():
+        hosts = iter_inv_hosts(inv)
     
-    if isinstance(inv, dict):  
-        for vm_name, ip in inv.items():
-            tasks.append(
-                async_cmd_exec(
+        if script is not None:
+            content, digest = read_script(script)
+    
+        history = None
+        if history_file:
+            history = load_history(history_file)
+            hosts = order_by_history(list(hosts), history)
+    
+        async def timed_cmd_exec(vm_name, ip, client=None):
+            start = time.monotonic()
+            if script is not None:
+                result = await async_script_exec(
                     ip,
-                    cmd_list,
+                    content,
+                    digest,
+                    script_args,
+                    script_env,
                     user,
                     password,
                     conn_timeout,
@@ -392,15 +782,13 @@ async def exec_async_main_pipeline(
                     check_ssh_conn,
                     vm_name,
                     log_to_console=True,
-                    log_to_file=False
+                    log_to_file=False,
+                    transport_profile=resolve_transport_profile(ip, transport_profile, host_transport_profiles),
+                    output_filter=output_filter,
+                    client=client
                     )
-                )
-        await asyncio.gather(*tasks)
-                
-    elif isinstance(inv, list):
-        for ip in inv:
-            tasks.append(
-                async_cmd_exec(
+            else:
+                result = await async_cmd_exec(
                     ip,
                     cmd_list,
                     user,
@@ -409,31 +797,172 @@ async def exec_async_main_pipeline(
                     exec_timeout,
                     strict,
                     check_ssh_conn,
+                    vm_name,
                     log_to_console=True,
-                    log_to_file=False
+                    log_to_file=False,
+                    transport_profile=resolve_transport_profile(ip, transport_profile, host_transport_profiles),
+                    output_filter=output_filter,
+                    client=client
                     )
-                )
-            # await async_cmd_exec(user, ip, cmd_list, strict, check_ssh_conn)
-        await asyncio.gather(*tasks)
-                
-    elif isinstance(inv, str):
-        ip = inv
-        tasks = [async_cmd_exec(
-                    ip,
-                    cmd_list,
-                    user,
-                    password,
-                    conn_timeout,
-                    exec_timeout,
-                    strict,
-                    check_ssh_conn,
-                    log_to_console=True,
-                    log_to_file=False
-                )
+            if history is not None:
+                record_duration(history, ip, time.monotonic() - start)
+            return result
+    
+        def prefetch_batch(batch):
+            # Only the hosts that start first are connected ahead, so at most
+            # max_concurrency connections are opened while a batch runs.
+            limit = len(batch) if max_concurrency is None else max_concurrency
+            return [
+                (vm_name, ip, asyncio.ensure_future(open_prefetched_connection(
+                    ip, user, password, resolve_transport_profile(ip, transport_profile, host_transport_profiles), conn_timeout
+                    )) if index < limit else None)
+                for index, (vm_name, ip) in enumerate(batch)
             ]
-        await asyncio.gather(*tasks)
         
-    else:
-        raise TypeError(f"The inventory must be a dictionary, a list or a string. Found: {type(inv)}")
+        async def prefetched_cmd_exec(vm_name, ip, conn_task):
+            client = await conn_task if conn_task is not None else None
+            if client is not None and client.is_closed():
+                print(f"Prefetched connection to {ip} was closed, reconnecting...")
+                client = None
+            try:
+                result = await timed_cmd_exec(vm_name, ip, client)
+                if client is not None and not result["ok"] and not result["outputs"] and client.is_closed():
+                    # The connection was lost before any command completed.
+                    print(f"Prefetched connection to {ip} was lost, reconnecting...")
+                    result = await timed_cmd_exec(vm_name, ip)
+                return result
+            finally:
+                if client is not None:
+                    client.close()
     
+        async def rolling_results():
+            batches = split_batches(list(hosts), batch_size)
+            failures = executed = 0
+            batch, next_batch = [(vm_name, ip, None) for vm_name, ip in batches[0]] if batches else [], []
+            
+            def pull_batch(index):
+                nonlocal next_batch
+                for position, host in enumerate(batch):
+                    if position == len(batch) - 1 and index + 1 < len(batches):
+                        # Connect the next batch while the last hosts of this one run.
+                        next_batch = prefetch_batch(batches[index + 1])
+                    yield host
+            
+            try:
+                for index in range(len(batches)):
+                    if index > 0:
+                        batch = next_batch or [(vm_name, ip, None) for vm_name, ip in batches[index]]
+                        next_batch = []
+                    
+                    feed = feed_tasks(pull_batch(index), prefetched_cmd_exec, max_concurrency)
+                    try:
+                        async for result in feed:
+                            executed += 1
+                            if not result["ok"]:
+                                failures += 1
+                            yield result
+                    finally:
+                        await feed.aclose()
+                        
+                    if is_failure_limit_exceeded(failures, executed, max_failures):
+                        remaining = sum(len(b) for b in batches[index + 1:])
+                        print(f"Aborting rolling run: {failures} of {executed} hosts failed, {remaining} hosts were not executed.")
+                        return
+            finally:
+                await close_prefetched_connections([conn_task for _, _, conn_task in batch + next_batch])
+    
+        if batch_size is None:
+            feed = feed_tasks(hosts, timed_cmd_exec, max_concurrency)
+        else:
+            feed = rolling_results()
+        try:
+            async for result in feed:
+                if not keep_outputs:
+                    result["outputs"] = [
+                        {"cmd": output["cmd"], "returncode": output["returncode"]}
+                        for output in result["outputs"]
+                    ]
+                yield result
+        finally:
+            await feed.aclose()
+            if history is not None:
+                save_history(history_file, history)
+                    
+    return AsyncResultIterator(host_results())
+    
+async def exec_async_main_pipeline(
+    inv: Union[str, dict, list, CompactInventory],
+    user: str,
+    password: str,
+    conn_timeout: Union[int, None],
+    exec_timeout: Union[int, None],
+    cmd_list: Union[str, List[str]],
+    strict=True,
+    check_ssh_conn=True,
+    log_to_console=True,
+    log_to_file=False,
+    max_concurrency: Union[int, None]=None,
+    history_file: Union[str, None]=None,
+    script: Union[str, None]=None,
+    script_args: Union[List[str], None]=None,
+    script_env: Union[dict, None]=None,
+    transport_profile: Union[str, None]=None,
+    host_transport_profiles: Union[dict, None]=None,
+    output_filter: Union[dict, None]=None,
+    batch_size: Union[int, str, None]=None,
+    max_failures: Union[int, str, None]=None,
+    keep_outputs=True,
+    ):
+    """Run the commands asynchronously and return the per-host results.
+    
+    When max_concurrency is given, at most that many hosts run at once. When
+    history_file is given, hosts that were slow in previous runs start first
+    and the durations of this run are saved to it. When script is given, the
+    local script is uploaded to hosts missing it from their cache and
+    executed instead of cmd_list. transport_profile selects the SSH transport
+    profile of the run and host_transport_profiles overrides it per host as
+    {ip: profile}. output_filter, built with make_output_filter, reduces and
+    compresses the output on the hosts.
+    
+    When batch_size is given as a count or a percentage such as "25%", hosts
+    run in rolling batches and the connections of the next batch are opened
+    once the current batch has started its last host. The run stops after
+    the batch where the failures exceed max_failures, a count or a
+    percentage of executed hosts. At most max_concurrency hosts of the next
+    batch are connected ahead, and hosts whose connection was lost meanwhile
+    connect again.
     
+    When keep_outputs is False, the stdout and stderr of the commands are
+    dropped from the results once they are logged, so huge fleets do not keep
+    every output in memory. Use iter_async_results to stream the results
+    instead of collecting them.
+    """
+    
+    results = []
+    async with iter_async_results(
+        inv=inv,
+        user=user,
+        password=password,
+        conn_timeout=conn_timeout,
+        exec_timeout=exec_timeout,
+        cmd_list=cmd_list,
+        strict=strict,
+        check_ssh_conn=check_ssh_conn,
+        log_to_console=log_to_console,
+        log_to_file=log_to_file,
+        max_concurrency=max_concurrency,
+        history_file=history_file,
+        script=script,
+        script_args=script_args,
+        script_env=script_env,
+        transport_profile=transport_profile,
+        host_transport_profiles=host_transport_profiles,
+        output_filter=output_filter,
+        batch_size=batch_size,
+        max_failures=max_failures,
+        keep_outputs=keep_outputs
+        ) as host_results:
+        async for result in host_results:
+            results.append(result)
+            
+    return results
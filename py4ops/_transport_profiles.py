@@ -0,0 +1,203 @@
+"""SSH transport profiles module.
+
+A transport profile is a named set of algorithm preferences, compression
+and flow control settings applied to both the asyncssh and paramiko
+backends. Profiles are selected per run or per inventory group with a
+``transport_profile`` key next to the ``hosts`` of a group.
+
+Algorithms that the installed backend does not support are left out of a
+profile, and a profile with none of its algorithms supported keeps the
+backend defaults.
+"""
+
+import functools
+import socket
+from typing import List, Union
+
+import yaml
+
+import asyncssh.compression
+import asyncssh.encryption
+import asyncssh.kex
+import asyncssh.mac
+import paramiko
+
+from ._checkers import is_valid_ip_address
+
+TRANSPORT_PROFILES = {
+    # Library defaults.
+    "default": {},
+    # Bulk output on fast links: hardware accelerated AEAD ciphers, large
+    # windows and no compression.
+    "throughput": {
+        "ciphers": [
+            "aes128-gcm@openssh.com",
+            "aes256-gcm@openssh.com",
+            "aes128-ctr",
+            "aes256-ctr",
+        ],
+        "macs": [
+            "umac-64-etm@openssh.com",
+            "hmac-sha2-256-etm@openssh.com",
+            "umac-64@openssh.com",
+            "hmac-sha2-256",
+        ],
+        "compression": False,
+        "window": 16 * 1024 * 1024,
+        "max_pktsize": 64 * 1024,
+    },
+    # Slow links: compress the stream.
+    "wan": {
+        "compression": True,
+    },
+    # Many short sessions: cheap elliptic curve key exchange.
+    "fast-connect": {
+        "kex": [
+            "curve25519-sha256",
+            "curve25519-sha256@libssh.org",
+            "ecdh-sha2-nistp256",
+        ],
+        "compression": False,
+    },
+}
+
+
+def get_transport_profile(name: Union[str, None]) -> dict:
+    """Return a transport profile by name."""
+
+    if name is None:
+        return TRANSPORT_PROFILES["default"]
+
+    if name not in TRANSPORT_PROFILES:
+        raise ValueError(f"Unknown transport profile: {name}. Available: {', '.join(TRANSPORT_PROFILES)}")
+
+    return TRANSPORT_PROFILES[name]
+
+def resolve_transport_profile(
+    ip: str,
+    transport_profile: Union[str, None]=None,
+    host_transport_profiles: Union[dict, None]=None,
+    ) -> Union[str, None]:
+    """Return the profile of a host, falling back to the profile of the run."""
+
+    if host_transport_profiles and ip in host_transport_profiles:
+        return host_transport_profiles[ip]
+    return transport_profile
+
+def supported_algorithms(algorithms: List[str], available) -> List[str]:
+    """Return the algorithms of a profile that are available, in the order of the profile."""
+
+    return [alg for alg in algorithms if alg in available]
+
+@functools.lru_cache(maxsize=None)
+def asyncssh_supported_algorithms() -> dict:
+    """Return the algorithms supported by the installed asyncssh."""
+
+    def decode(algs):
+        return frozenset(alg.decode("ascii") for alg in algs)
+
+    return {
+        "ciphers": decode(asyncssh.encryption.get_encryption_algs()),
+        "macs": decode(asyncssh.mac.get_mac_algs()),
+        "kex": decode(asyncssh.kex.get_kex_algs()),
+        "compression": decode(asyncssh.compression.get_compression_algs()),
+    }
+
+@functools.lru_cache(maxsize=None)
+def paramiko_supported_algorithms() -> dict:
+    """Return the algorithms supported by the installed paramiko."""
+
+    # The security options of a transport that is never started, whose
+    # close() leaves the socket open.
+    sock = socket.socket()
+    transport = paramiko.Transport(sock)
+    try:
+        security_options = transport.get_security_options()
+        return {
+            "ciphers": tuple(security_options.ciphers),
+            "macs": tuple(security_options.digests),
+            "kex": tuple(security_options.kex),
+        }
+    finally:
+        transport.close()
+        sock.close()
+
+def asyncssh_connect_options(name: Union[str, None]) -> dict:
+    """Return the asyncssh.connect keyword arguments of a profile."""
+
+    profile = get_transport_profile(name)
+    supported = asyncssh_supported_algorithms()
+    options = {}
+
+    for key, option in (("ciphers", "encryption_algs"), ("macs", "mac_algs"), ("kex", "kex_algs")):
+        if key in profile:
+            algorithms = supported_algorithms(profile[key], supported[key])
+            if algorithms:
+                options[option] = algorithms
+    if "compression" in profile:
+        algorithms = ["zlib@openssh.com", "zlib", "none"] if profile["compression"] else ["none"]
+        options["compression_algs"] = supported_algorithms(algorithms, supported["compression"])
+
+    return options
+
+def asyncssh_session_options(name: Union[str, None]) -> dict:
+    """Return the SSHClientConnection.run keyword arguments of a profile."""
+
+    profile = get_transport_profile(name)
+    return {key: profile[key] for key in ("window", "max_pktsize") if key in profile}
+
+def paramiko_connect_options(name: Union[str, None]) -> dict:
+    """Return the paramiko.SSHClient.connect keyword arguments of a profile.
+
+    Paramiko has no preference lists, so algorithms not in the profile are
+    disabled instead.
+    """
+
+    profile = get_transport_profile(name)
+    supported = paramiko_supported_algorithms()
+    options = {}
+    disabled_algorithms = {}
+
+    for key in ("ciphers", "macs", "kex"):
+        if key in profile and supported_algorithms(profile[key], supported[key]):
+            disabled_algorithms[key] = [alg for alg in supported[key] if alg not in profile[key]]
+
+    if disabled_algorithms:
+        options["disabled_algorithms"] = disabled_algorithms
+    if "compression" in profile:
+        options["compress"] = profile["compression"]
+
+    return options
+
+def apply_paramiko_session_options(client: paramiko.SSHClient, name: Union[str, None]):
+    """Apply the window and packet sizes of a profile to a connected paramiko client."""
+
+    profile = get_transport_profile(name)
+    transport = client.get_transport()
+
+    if "window" in profile:
+        transport.default_window_size = profile["window"]
+    if "max_pktsize" in profile:
+        transport.default_max_packet_size = profile["max_pktsize"]
+
+def get_transport_profiles_from_yaml(inv: str) -> dict:
+    """Get the transport profiles of the inventory groups as {ip: profile}."""
+
+    with open(inv, "r") as stream:
+        f = yaml.safe_load(stream)
+
+    if not isinstance(f, dict):
+        raise TypeError("The YAML file must be a dictionary.")
+
+    host_profiles = {}
+    for group in f.values():
+        if not isinstance(group, dict) or "transport_profile" not in group:
+            continue
+
+        profile = group["transport_profile"]
+        get_transport_profile(profile)
+        for key, value in group["hosts"].items():
+            ip = key if is_valid_ip_address(str(key)) else value
+            host_profiles[ip] = profile
+
+    return host_profiles
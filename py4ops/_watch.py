@@ -0,0 +1,110 @@
+"""Watch module.
+
+Re-run a command across the fleet at a fixed interval over SSH sessions
+that stay open between iterations, and report only the hosts whose output
+or exit code changed since the previous iteration. Only a digest of the
+last output is kept per host.
+"""
+
+import asyncio
+import hashlib
+import time
+from typing import Union
+
+import asyncssh
+
+from ._ssh_orchestration import iter_inv_hosts, feed_tasks, new_host_result, add_cmd_output
+from ._transport_profiles import asyncssh_connect_options, asyncssh_session_options, resolve_transport_profile
+from ._output_filters import async_run_filtered
+
+
+def output_digest(returncode: Union[int, None], stdout: str) -> str:
+    """Return the digest of the exit code and output of a command."""
+
+    return hashlib.sha256(f"{returncode}\0{stdout}".encode("utf8")).hexdigest()
+
+async def exec_watch_pipeline(
+    inv: Union[str, dict, list],
+    user: str,
+    password: str,
+    conn_timeout: Union[int, None],
+    exec_timeout: Union[int, None],
+    cmd: str,
+    interval: float=2.0,
+    iterations: Union[int, None]=None,
+    max_concurrency: Union[int, None]=None,
+    transport_profile: Union[str, None]=None,
+    host_transport_profiles: Union[dict, None]=None,
+    output_filter: Union[dict, None]=None,
+    log_to_console=True,
+    ):
+    """Re-run a command every interval seconds and print the hosts whose result changed.
+
+    Runs forever unless iterations is given. Connections are kept open
+    between iterations and re-opened on the next iteration if they fail.
+    """
+
+    connections = {}
+    digests = {}
+
+    async def watch_host(vm_name, ip):
+        host_result = new_host_result(ip, vm_name)
+        profile = resolve_transport_profile(ip, transport_profile, host_transport_profiles)
+        conn = connections.get(ip)
+        try:
+            if conn is None:
+                conn = await asyncio.wait_for(
+                    asyncssh.connect(host=ip, username=user, password=password, **asyncssh_connect_options(profile)),
+                    timeout=conn_timeout
+                    )
+                connections[ip] = conn
+            if output_filter:
+                result = await async_run_filtered(conn, cmd, output_filter, exec_timeout, **asyncssh_session_options(profile))
+            else:
+                result = await conn.run(cmd, check=False, timeout=exec_timeout, **asyncssh_session_options(profile))
+            add_cmd_output(host_result, cmd, result.returncode, result.stdout, result.stderr)
+            digest = output_digest(result.returncode, result.stdout)
+        except Exception as e:
+            host_result["ok"] = False
+            host_result["error"] = str(e)
+            digest = output_digest(None, str(e))
+            if connections.pop(ip, None) is not None:
+                conn.close()
+
+        return host_result, digest
+
+    iteration = 0
+    try:
+        while iterations is None or iteration < iterations:
+            start = time.monotonic()
+            changed = 0
+
+            feed = feed_tasks(iter_inv_hosts(inv), watch_host, max_concurrency)
+            try:
+                async for host_result, digest in feed:
+                    ip = host_result["ip"]
+                    if digests.get(ip) == digest:
+                        continue
+                    digests[ip] = digest
+                    changed += 1
+
+                    if host_result["error"] is not None:
+                        print(f"Changed -> {ip} - {host_result['vm_name']}: {host_result['error']}")
+                        continue
+                    output = host_result["outputs"][0]
+                    print(f"Changed -> {ip} - {host_result['vm_name']} (exit code {output['returncode']})")
+                    if log_to_console:
+                        print(output["stdout"])
+            finally:
+                await feed.aclose()
+
+            iteration += 1
+            print(f"Iteration {iteration}: {changed} hosts changed in {time.monotonic() - start:.2f}s")
+
+            if iterations is None or iteration < iterations:
+                await asyncio.sleep(max(0.0, interval - (time.monotonic() - start)))
+    finally:
+        for conn in connections.values():
+            conn.close()
+        for conn in connections.values():
+            await conn.wait_closed()